@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 
@@ -43,12 +44,21 @@ INSTALLED_APPS = [
     'example',
     'shop',
     'rest_framework',
-    'drf_yasg',
 ]
 
+# drf_yasg only builds the OpenAPI schema and docs pages. build_files.sh writes them
+# under STATIC_ROOT, and deployed functions leave drf_yasg out and redirect there.
+# It is only in requirements-build.txt, so it is left out wherever it is not installed.
+SHOP_PREBUILT_SCHEMA = config(
+    'SHOP_PREBUILT_SCHEMA', default=config('VERCEL', default=False, cast=bool) or not find_spec('drf_yasg'), cast=bool,
+)
+if not SHOP_PREBUILT_SCHEMA:
+    INSTALLED_APPS.append('drf_yasg')
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # Only the admin uses sessions; the API authenticates with bearer tokens
+    'shop.authentication.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -56,6 +66,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Server-Timing headers and per-route histograms, exported at /api/metrics
+SHOP_METRICS = config('SHOP_METRICS', default=False, cast=bool)
+if SHOP_METRICS:
+    MIDDLEWARE.insert(0, 'shop.metrics.MetricsMiddleware')
+
 ROOT_URLCONF = 'api.urls'
 
 TEMPLATES = [
@@ -94,6 +109,67 @@ DATABASES['default'] = dj_database_url.config()
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# The 'shop' alias holds cached catalog responses and the bearer token denylist;
+# SHOP_CACHE_BACKEND picks local memory, a file cache shared by every process on
+# the host, or Redis (needs the redis package) shared by every host. Sign-outs
+# only reach the processes that share the cache.
+
+SHOP_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shop',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('SHOP_CACHE_LOCATION', default='/tmp/shop_cache'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('SHOP_CACHE_LOCATION', default='redis://127.0.0.1:6379'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shop': SHOP_CACHE_BACKENDS[config('SHOP_CACHE_BACKEND', default='locmem')],
+}
+
+SHOP_CACHE_ALIAS = 'shop'
+SHOP_CACHE_TIMEOUT = config('SHOP_CACHE_TIMEOUT', default=300, cast=int)
+
+
+# REST framework
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'shop.authentication.BearerTokenAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    # JSONRenderer answers plain application/json and */*, and any request the
+    # negotiation cannot satisfy; the fast JSON and MessagePack renderers are
+    # only picked when a client asks for them
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'shop.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['shop.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'shop.renderers.ContentNegotiation',
+}
+
+SHOP_TOKEN_LIFETIME = config('SHOP_TOKEN_LIFETIME', default=24 * 60 * 60, cast=int)
+
+SWAGGER_SETTINGS = {
+    'SECURITY_DEFINITIONS': {
+        'Bearer': {'type': 'apiKey', 'name': 'Authorization', 'in': 'header'},
+        'basic': {'type': 'basic'},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -135,6 +211,12 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored once per distinct content, named by their SHA-256
+DEFAULT_FILE_STORAGE = 'shop.storage.ContentAddressedStorage'
+
+# Processes rendering product image variants; 0 renders them inside the request
+SHOP_IMAGE_WORKERS = config('SHOP_IMAGE_WORKERS', default=2, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -1,34 +1,17 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework.permissions import AllowAny
 
+from shop.startup import LazyView
 
-SchemaView = get_schema_view(
-    info=openapi.Info(
-        title='Store',
-        default_version='v1.0',
-        description='This is an electronic grocery store',
-        terms_of_service='',
-        contact=openapi.Contact(name='Suyog Mahajan', url='', email='SuyogMahajan2111@gmail.com'),
-        license=openapi.License(name='JustCode', url='')
-    ),
-
-    patterns=[
-        path('', include('shop.urls')),
-    ],
-    public=True,
-    permission_classes=[AllowAny, ]
-)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('shop.urls')),
     path('example/', include('example.urls')),
-    path('', SchemaView.with_ui()),
+    re_path(r'^media/(?P<path>.+)$', LazyView('shop.storage.serve_media')),
+    path('', LazyView('shop.schema.schema_ui_view'), {'ui': 'swagger'}),
 ]
 
 # urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,9 +1,14 @@
 echo "Building Project"
-python3 -m pip install -r requirements.txt
+python3 -m pip install -r requirements-build.txt
 
 echo "Making Migration"
 python3 manage.py makemigrations --noinput
 python3 manage.py migrate --noinput 
 
+# drf_yasg comes from requirements-build.txt, which only the build installs;
+# the deployed functions get requirements.txt and serve this output
 echo "Collect Static"
-python3 manage.py collectstatic --noinput --clear
\ No newline at end of file
+SHOP_PREBUILT_SCHEMA=0 python3 manage.py collectstatic --noinput --clear
+
+echo "Build OpenAPI schema"
+SHOP_PREBUILT_SCHEMA=0 python3 manage.py build_schema
@@ -0,0 +1,185 @@
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, Product, SalesSummary
+
+
+# Summary columns in the order the delta tuples below use them
+COLUMNS = ['orders', 'quantity', 'revenue', 'delivered_orders', 'delivered_revenue']
+DIMENSION_KEYS = {
+    'product': 'product_id',
+    'category': 'product__category_id',
+    'manufacturer': 'product__manufacturer_id',
+}
+UNCATEGORIZED = 0
+
+
+def get_state(order):
+    """
+    The part of an order the summaries depend on, to diff before and after a
+    change. Reads the product the order already holds.
+    """
+    product = order.product
+    return (
+        order.product_id, product.category_id, product.manufacturer_id, order.quantity,
+        product.price * order.quantity, order.status, timezone.localdate(order.created_at),
+    )
+
+
+def get_stored_state(pk):
+    row = Order.objects.filter(pk=pk).values_list(
+        'product_id', 'product__category_id', 'product__manufacturer_id', 'quantity', 'product__price', 'status',
+        'created_at',
+    ).first()
+    if row is None:
+        return None
+    product_id, category_id, manufacturer_id, quantity, price, status, created_at = row
+    return (product_id, category_id, manufacturer_id, quantity, price * quantity, status, timezone.localdate(created_at))
+
+
+def add_deltas(deltas, states, sign):
+    for product_id, category_id, manufacturer_id, quantity, revenue, status, day in states:
+        delivered = status == 'delivery'
+        values = (1, quantity, revenue, int(delivered), revenue if delivered else 0)
+        keys = [('product', product_id), ('category', category_id or UNCATEGORIZED), ('manufacturer', manufacturer_id)]
+        for dimension, key in keys:
+            totals = deltas[(dimension, key, day)]
+            for index, value in enumerate(values):
+                totals[index] += sign * value
+
+
+def record_change(before=(), after=()):
+    """
+    Move the summaries from the ``before`` order states to the ``after`` ones.
+
+    Must run in the transaction that writes the orders. The deltas are merged
+    per summary row and written with one upsert.
+    """
+    deltas = defaultdict(lambda: [0] * len(COLUMNS))
+    add_deltas(deltas, before, -1)
+    add_deltas(deltas, after, 1)
+    apply_deltas(deltas)
+
+
+def move_products(changes):
+    """
+    Move the summaries of products whose category or manufacturer changed.
+    ``changes`` maps a product id to its ``(category_id, manufacturer_id)``
+    before and after the change. The per-day totals of each product are
+    subtracted from its old keys and added to its new ones.
+    """
+    changes = {product_id: (before, after) for product_id, (before, after) in changes.items() if before != after}
+    if not changes:
+        return
+    deltas = defaultdict(lambda: [0] * len(COLUMNS))
+    rows = SalesSummary.objects.filter(dimension='product', key__in=changes).values_list('key', 'day', *COLUMNS)
+    for product_id, day, *values in rows:
+        before, after = changes[product_id]
+        for dimension, old, new in zip(('category', 'manufacturer'), before, after):
+            if dimension == 'category':
+                old, new = old or UNCATEGORIZED, new or UNCATEGORIZED
+            if old == new:
+                continue
+            for key, sign in ((old, -1), (new, 1)):
+                totals = deltas[(dimension, key, day)]
+                for index, value in enumerate(values):
+                    totals[index] += sign * value
+    apply_deltas(deltas)
+
+
+def apply_deltas(deltas, batch_size=100):
+    """
+    Add ``deltas`` to their summary rows with ``INSERT ... ON CONFLICT DO
+    UPDATE``, inserting the rows that do not exist yet. Rows are written in
+    key order, so concurrent writers lock them in the same order.
+    """
+    rows = [
+        (dimension, key, connection.ops.adapt_datefield_value(day), *values)
+        for (dimension, key, day), values in sorted(deltas.items()) if any(values)
+    ]
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(SalesSummary._meta.db_table)
+    columns = ['dimension', 'key', 'day', *COLUMNS]
+    placeholders = f'({", ".join(["%s"] * len(columns))})'
+    increments = ', '.join(f'{quote(column)} = {table}.{quote(column)} + EXCLUDED.{quote(column)}' for column in COLUMNS)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(map(quote, columns))}) VALUES {", ".join([placeholders] * len(batch))} '
+                f'ON CONFLICT ({", ".join(map(quote, ["dimension", "key", "day"]))}) DO UPDATE SET {increments}',
+                [value for row in batch for value in row],
+            )
+
+
+def aggregate_orders(orders, dimension):
+    """
+    Group ``orders`` into summary values per day and ``dimension`` key in SQL.
+    """
+    return orders.annotate(
+        summary_day=TruncDate('created_at'),
+        summary_key=F(DIMENSION_KEYS[dimension]),
+        gross=F('product__price') * F('quantity'),
+    ).values('summary_day', 'summary_key').annotate(
+        orders=Count('id'),
+        quantity=Sum('quantity'),
+        revenue=Sum('gross'),
+        delivered_orders=Count('id', filter=Q(status='delivery')),
+        delivered_revenue=Sum('gross', filter=Q(status='delivery')),
+    ).order_by()
+
+
+def rebuild_summaries(order_model=Order, summary_model=SalesSummary, batch_size=50000):
+    """
+    Recompute every summary row from the orders, aggregating ``batch_size``
+    orders at a time, and swap the result in within one transaction.
+    """
+    totals = defaultdict(lambda: [0] * len(COLUMNS))
+    with transaction.atomic():
+        last_id = order_model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        for start in range(0, last_id, batch_size):
+            batch = order_model.objects.filter(id__gt=start, id__lte=start + batch_size)
+            for dimension in DIMENSION_KEYS:
+                for row in aggregate_orders(batch, dimension):
+                    key = row['summary_key'] if row['summary_key'] is not None else UNCATEGORIZED
+                    summary = totals[(dimension, key, row['summary_day'])]
+                    for index, column in enumerate(COLUMNS):
+                        summary[index] += row[column] or 0
+
+        summary_model.objects.all().delete()
+        summary_model.objects.bulk_create(
+            [
+                summary_model(dimension=dimension, key=key, day=day, **dict(zip(COLUMNS, values)))
+                for (dimension, key, day), values in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
+
+
+def get_summary(dimension, start, end, key=None, group='day', limit=100):
+    """
+    Read at most ``limit`` summary rows of ``dimension`` between ``start`` and
+    ``end``, per day and key or, with ``group='total'``, summed per key by revenue.
+    """
+    rows = SalesSummary.objects.filter(dimension=dimension, day__gte=start, day__lte=end)
+    if key is not None:
+        rows = rows.filter(key=key)
+    if group == 'total':
+        rows = rows.values('key').annotate(**{column: Sum(column) for column in COLUMNS}).order_by('-revenue', 'key')[:limit]
+    else:
+        rows = rows.order_by('day', 'key').values('day', 'key', *COLUMNS)[:limit]
+    rows = list(rows)
+
+    model = Product if dimension == 'product' else apps.get_model('shop', dimension)
+    names = dict(model.objects.filter(id__in={row['key'] for row in rows}).values_list('id', 'name'))
+    for row in rows:
+        row['name'] = names.get(row['key'])
+    return rows
@@ -0,0 +1,127 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions import middleware
+from django.core import signing
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .cache import get_cache
+from .models import Customer
+
+
+TOKEN_SALT = 'shop.authentication.token'
+API_PREFIX = '/api/'
+# Payload key -> the Customer column it carries. A change to any of them, or to
+# is_active or the password, revokes the customer's tokens (see shop/signals.py).
+TOKEN_CLAIMS = {'u': 'id', 'p': 'phone', 's': 'is_staff', 'a': 'is_superuser'}
+TOKEN_FIELDS = [*TOKEN_CLAIMS.values(), 'is_active']
+
+
+def get_token_lifetime():
+    return getattr(settings, 'SHOP_TOKEN_LIFETIME', 24 * 60 * 60)
+
+
+def get_revocation_key(customer_id):
+    return f'shop:token-revoked:{customer_id}'
+
+
+def get_revoked_at(customer_id):
+    return get_cache().get(get_revocation_key(customer_id), 0)
+
+
+def issue_token(customer):
+    """
+    Sign a bearer token carrying the ``TOKEN_CLAIMS`` of the customer, the
+    issue time in milliseconds and the expiry time.
+    """
+    payload = {key: getattr(customer, field) for key, field in TOKEN_CLAIMS.items()}
+    # Issued after any revocation, even one in the same millisecond
+    payload['i'] = max(time.time_ns() // 1000000, get_revoked_at(customer.pk) + 1)
+    payload['e'] = int(time.time()) + get_token_lifetime()
+    return signing.Signer(salt=TOKEN_SALT).sign_object(payload, compress=True)
+
+
+def read_token(token):
+    """
+    Return the payload of a valid, unexpired and unrevoked token, or None.
+    """
+    try:
+        payload = signing.Signer(salt=TOKEN_SALT).unsign_object(token)
+    except (signing.BadSignature, ValueError):
+        return None
+    if not isinstance(payload, dict) or payload.get('e', 0) <= time.time():
+        return None
+    if payload.get('i', 0) <= get_revoked_at(payload.get('u')):
+        return None
+    return payload
+
+
+def revoke_tokens(customer_id):
+    """
+    Revoke every token issued to the customer so far.
+
+    The denylist holds one timestamp per customer in the shop cache, which
+    expires with the last token it can reject; it needs a cache shared by
+    every process (``SHOP_CACHE_BACKEND``) to take effect everywhere.
+    """
+    get_cache().set(get_revocation_key(customer_id), time.time_ns() // 1000000, get_token_lifetime())
+
+
+def load_customer(customer):
+    # Fetch whatever a token-authenticated customer has not loaded yet in one query
+    deferred = customer.get_deferred_fields()
+    if deferred:
+        customer.refresh_from_db(fields=list(deferred))
+    return customer
+
+
+class BearerTokenAuthentication(BaseAuthentication):
+    """
+    Authenticate ``Authorization: Bearer <token>`` without touching the
+    database: one denylist lookup in the shop cache.
+
+    ``request.user`` is a ``Customer`` holding only ``TOKEN_FIELDS``, taken
+    from the token; any other field is loaded from the database on first
+    access.
+    ``request.auth`` is the token payload.
+    """
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header')
+
+        payload = read_token(auth[1].decode('latin-1'))
+        if payload is None:
+            raise exceptions.AuthenticationFailed('Invalid or expired token')
+        values = {field: payload.get(key) for key, field in TOKEN_CLAIMS.items()}
+        values['is_active'] = True
+        # from_db takes the loaded columns in model order and defers the rest
+        fields = [field.attname for field in Customer._meta.concrete_fields if field.attname in values]
+        customer = Customer.from_db('default', fields, [values[field] for field in fields])
+        return customer, payload
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+class SessionMiddleware(middleware.SessionMiddleware):
+    """
+    Sessions for the admin only. API requests authenticate with bearer tokens
+    and get an empty session that is never loaded from or saved to the
+    session table.
+    """
+    def process_request(self, request):
+        if request.path_info.startswith(API_PREFIX):
+            request.session = self.SessionStore()
+        else:
+            super().process_request(request)
+
+    def process_response(self, request, response):
+        if request.path_info.startswith(API_PREFIX):
+            return response
+        return super().process_response(request, response)
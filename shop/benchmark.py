@@ -0,0 +1,38 @@
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .generator import Generator
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back(keep=False):
+    """Run a benchmark inside a transaction that is rolled back unless ``keep`` is set."""
+    try:
+        with transaction.atomic():
+            yield
+            if not keep:
+                raise Rollback
+    except Rollback:
+        pass
+
+
+def seed_data(products, orders=0, seed=0):
+    """
+    Generate ``products`` products and ``orders`` orders with the data
+    generator, with a manufacturer per 100 products and a customer per 10
+    orders. Returns the seconds taken.
+    """
+    started = time.perf_counter()
+    customers = -(-orders // 10)
+    Generator(seed, log=lambda message: None).run(customers, -(-products // 100), products, orders)
+    return time.perf_counter() - started
+
+
+def seed_products(count, seed=0):
+    return seed_data(count, seed=seed)
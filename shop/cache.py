@@ -0,0 +1,121 @@
+import hashlib
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+
+hits = Counter()
+misses = Counter()
+
+
+def get_cache():
+    return caches[getattr(settings, 'SHOP_CACHE_ALIAS', 'shop')]
+
+
+def get_version_key(model):
+    return f'shop:version:{model._meta.label_lower}'
+
+
+def get_versions(models):
+    cache = get_cache()
+    keys = [get_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from a timestamp so an evicted counter never reuses an old version
+            cache.add(key, time.time_ns())
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(model):
+    cache = get_cache()
+    key = get_version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns())
+
+
+def cache_response(*models):
+    """
+    Cache the data of a successful GET keyed on the full path and the current
+    versions of ``models``; any write to one of them bumps its version and so
+    invalidates every cached response that read it.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            name = view.__class__.__name__
+            cache = get_cache()
+            versions = ':'.join(str(version) for version in get_versions(models))
+            digest = hashlib.md5(f'{versions}:{request.build_absolute_uri()}'.encode()).hexdigest()
+            key = f'shop:response:{name}:{digest}'
+
+            data = cache.get(key)
+            if data is not None:
+                # Imported here so the signal handlers loaded at startup do not pull in DRF
+                from rest_framework.response import Response
+
+                hits[name] += 1
+                return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+
+            misses[name] += 1
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, getattr(settings, 'SHOP_CACHE_TIMEOUT', 300))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_response(get_state, use_last_modified=True):
+    """
+    Answer ``If-None-Match`` / ``If-Modified-Since`` with ``304 Not Modified``
+    before the view body runs.
+
+    ``get_state(view, request, *args, **kwargs)`` returns the versions the
+    response is built from (``updated_at`` values of a row, or the
+    ``get_versions`` counters of a collection), or None to let the view handle
+    a missing object. The strong ETag hashes those versions with
+    the URL and Accept header, so the body never has to be serialized for it.
+    Collections should pass ``use_last_modified=False``: a deleted row does not
+    move their newest timestamp.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            state = get_state(view, request, *args, **kwargs)
+            if state is None:
+                return method(view, request, *args, **kwargs)
+
+            key = repr([request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), *state])
+            etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+            timestamps = [value.timestamp() for value in state if hasattr(value, 'timestamp')]
+            last_modified = int(max(timestamps)) if timestamps and use_last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def get_stats():
+    return {
+        name: {'hits': hits[name], 'misses': misses[name]}
+        for name in sorted(set(hits) | set(misses))
+    }
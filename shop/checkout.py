@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models import F
+
+from .analytics import get_state, record_change
+from .cache import bump_version
+from .models import Customer, Order
+
+
+def charge_wallet(customer, amount):
+    """
+    Take up to ``amount`` from the customer's wallet and return what was taken.
+
+    Must run inside a transaction. The common case is a single conditional
+    ``UPDATE ... SET wallet = wallet - amount WHERE wallet >= amount``; only a
+    wallet that can't cover the amount is locked and drained, so concurrent
+    checkouts can never spend the same balance twice.
+    """
+    if amount <= 0:
+        return 0
+    customers = Customer.objects.filter(pk=customer.pk)
+    if customers.filter(wallet__gte=amount).update(wallet=F('wallet') - amount):
+        return amount
+    balance = customers.select_for_update().values_list('wallet', flat=True).get()
+    balance = min(balance, amount)
+    if balance:
+        customers.update(wallet=F('wallet') - balance)
+    return balance
+
+
+def checkout_cart(customer, items, delivery_address):
+    """
+    Place one order line per cart item in a single transaction.
+
+    The wallet is charged once for the basket total and the amount taken is
+    spread over the lines in cart order; all lines are inserted with one
+    ``bulk_create``.
+    """
+    total = sum(item['product'].price * item['quantity'] for item in items)
+    with transaction.atomic():
+        paid = charge_wallet(customer, total)
+        orders = []
+        for item in items:
+            line_total = item['product'].price * item['quantity']
+            covered = min(paid, line_total)
+            paid -= covered
+            orders.append(Order(
+                product=item['product'],
+                quantity=item['quantity'],
+                customer=customer,
+                phone_customer=customer.phone,
+                delivery_address=delivery_address,
+                final_price=line_total - covered,
+            ))
+        Order.objects.bulk_create(orders)
+        # bulk_create sends no post_save, so the summaries are updated here
+        record_change(after=[get_state(order) for order in orders])
+    bump_version(Order)
+    return orders
@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from .metrics import timed_iterator
+
+
+PRODUCT_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('manufacturer', 'manufacturer__name'),
+    ('category', 'category__name'),
+    ('price', 'price'),
+    ('value', 'value'),
+    ('unit', 'unit'),
+    ('manufacturing_date', 'manufacturing_date'),
+    ('expired_date', 'expired_date'),
+    ('image', 'image'),
+]
+
+ORDER_COLUMNS = [
+    ('id', 'id'),
+    ('product', 'product__name'),
+    ('quantity', 'quantity'),
+    ('customer', 'customer__email'),
+    ('phone_customer', 'phone_customer'),
+    ('status', 'status'),
+    ('delivery_address', 'delivery_address'),
+    ('final_price', 'final_price'),
+]
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error responses are rendered; exports stream their own body
+        return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+def iter_rows(queryset, columns, chunk_size):
+    lookups = [lookup for _, lookup in columns]
+    image = lookups.index('image') if 'image' in lookups else None
+    for row in queryset.values_list(*lookups).iterator(chunk_size=chunk_size):
+        if image is not None and row[image]:
+            row = row[:image] + (default_storage.url(row[image]),) + row[image + 1:]
+        yield row
+
+
+def stream_ndjson(rows, names, chunk_size):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_csv(rows, names, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+STREAMS = {
+    'ndjson': stream_ndjson,
+    'csv': stream_csv,
+}
+
+
+def export_response(queryset, columns, export_format, filename, chunk_size=2000):
+    """
+    Stream ``queryset`` as NDJSON or CSV.
+
+    Rows are read as flat tuples through a server-side cursor in chunks of
+    ``chunk_size`` and written out chunk by chunk, so memory stays flat
+    whatever the size of the table.
+    """
+    names = [name for name, _ in columns]
+    rows = iter_rows(queryset, columns, chunk_size)
+    content_type = CSVRenderer.media_type if export_format == 'csv' else NDJSONRenderer.media_type
+    response = StreamingHttpResponse(
+        # The rows are fetched and encoded as the body is sent, outside DRF's serializers
+        timed_iterator(STREAMS[export_format](rows, names, chunk_size)),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
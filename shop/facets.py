@@ -0,0 +1,126 @@
+from django.db.models import Count, Max, Min, Q
+
+from .models import UNIT_CHOICES
+
+
+# Upper bounds (exclusive) of the price histogram buckets; the last bucket is open-ended
+PRICE_BUCKETS = (50, 100, 200, 500, 1000)
+# Values listed per facet, largest counts first
+FACET_LIMIT = 100
+
+FILTER_LOOKUPS = {
+    'category': 'category_id__in',
+    'manufacturer': 'manufacturer_id__in',
+    'country': 'manufacturer__country_id__in',
+    'unit': 'unit__in',
+}
+# Facet name -> (grouped column, label column)
+FACETS = {
+    'category': ('category_id', 'category__name'),
+    'manufacturer': ('manufacturer_id', 'manufacturer__name'),
+    'unit': ('unit', None),
+}
+UNITS = [unit for unit, _ in UNIT_CHOICES]
+
+
+def parse_ids(name, value):
+    try:
+        ids = [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValueError(f'{name} must be a comma separated list of ids')
+    if not ids:
+        raise ValueError(f'{name} must not be empty')
+    return ids
+
+
+def parse_price(name, value):
+    try:
+        price = int(value)
+    except ValueError:
+        price = -1
+    if price < 0:
+        raise ValueError(f'{name} must be a non-negative integer')
+    return price
+
+
+def get_product_filters(params):
+    """
+    Read ``category``, ``manufacturer``, ``country`` (of the manufacturer) and
+    ``unit`` as comma separated lists, and the inclusive ``price_min`` and
+    ``price_max``. Raises ValueError on malformed values.
+    """
+    filters = {}
+    for name in ('category', 'manufacturer', 'country'):
+        if name in params.keys():
+            filters[name] = parse_ids(name, params.get(name))
+    if 'unit' in params.keys():
+        units = [unit.strip() for unit in params.get('unit').split(',') if unit.strip()]
+        unknown = [unit for unit in units if unit not in UNITS]
+        if not units or unknown:
+            raise ValueError(f'unit must be one of: {", ".join(UNITS)}')
+        filters['unit'] = units
+    price = [parse_price(name, params.get(name)) if name in params.keys() else None for name in ('price_min', 'price_max')]
+    if price != [None, None]:
+        filters['price'] = price
+    return filters
+
+
+def filter_products(queryset, filters, exclude=None):
+    """
+    Apply ``filters`` except the one named ``exclude``. Values of one filter
+    are OR-ed, different filters are AND-ed.
+    """
+    for name, value in filters.items():
+        if name == exclude:
+            continue
+        if name == 'price':
+            price_min, price_max = value
+            if price_min is not None:
+                queryset = queryset.filter(price__gte=price_min)
+            if price_max is not None:
+                queryset = queryset.filter(price__lte=price_max)
+        else:
+            queryset = queryset.filter(**{FILTER_LOOKUPS[name]: value})
+    return queryset
+
+
+def get_price_histogram(queryset):
+    # Every bucket is a filtered COUNT of the same single aggregate query
+    bounds = [0, *PRICE_BUCKETS, None]
+    buckets = list(zip(bounds, bounds[1:]))
+    aggregates = {
+        f'bucket_{index}': Count('id', filter=Q(price__gte=low) & (Q(price__lt=high) if high is not None else Q()))
+        for index, (low, high) in enumerate(buckets)
+    }
+    row = queryset.aggregate(min=Min('price'), max=Max('price'), **aggregates)
+    return {
+        'min': row['min'],
+        'max': row['max'],
+        'buckets': [
+            {'min': low, 'max': high - 1 if high is not None else None, 'count': row[f'bucket_{index}']}
+            for index, (low, high) in enumerate(buckets)
+        ],
+    }
+
+
+def get_facets(queryset, filters):
+    """
+    Count the products matching ``filters`` per category, manufacturer and
+    unit, and bucket their prices: one GROUP BY query per facet.
+
+    Each facet leaves out its own filter, so the counts show what selecting
+    another value of it would return; every other filter still applies.
+    """
+    queryset = queryset.order_by()
+    facets = {}
+    for name, (key, label) in FACETS.items():
+        columns = [key, label] if label else [key]
+        rows = filter_products(queryset, filters, exclude=name).values(*columns).annotate(
+            count=Count('id'),
+        ).order_by('-count', key)[:FACET_LIMIT]
+        if label:
+            facets[name] = [{'id': row[key], 'name': row[label], 'count': row['count']} for row in rows]
+        else:
+            facets[name] = [{'value': row[key], 'count': row['count']} for row in rows]
+    facets['price'] = get_price_histogram(filter_products(queryset, filters, exclude='price'))
+    return facets
@@ -0,0 +1,309 @@
+import datetime
+import itertools
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import search
+from .cache import bump_version
+from .models import *
+
+
+CHUNK_SIZE = 50_000
+COUNTRIES = [
+    'Russia', 'Germany', 'France', 'Italy', 'Spain', 'Poland', 'Turkey', 'China', 'India', 'Brazil',
+    'Argentina', 'Chile', 'Netherlands', 'Belgium', 'Finland', 'Norway', 'Kazakhstan', 'Georgia', 'Serbia', 'Greece',
+]
+CATEGORIES = [
+    'Dairy', 'Bakery', 'Meat', 'Fish', 'Fruit', 'Vegetables', 'Frozen', 'Drinks', 'Coffee and tea', 'Snacks',
+    'Sweets', 'Cereals', 'Pasta and rice', 'Canned food', 'Sauces', 'Spices', 'Baby food', 'Pet food',
+    'Household', 'Cosmetics',
+]
+# Relative share of the products in each category, so some categories are much bigger than others
+CATEGORY_WEIGHTS = [18, 10, 9, 5, 8, 9, 6, 8, 4, 7, 6, 4, 4, 4, 3, 2, 2, 2, 5, 4]
+WORDS = (
+    'apple banana milk cheese bread butter organic fresh whole wheat yogurt rice pasta tomato potato onion '
+    'garlic chicken beef salmon tuna coffee tea juice water sugar salt pepper honey chocolate cookie cereal '
+    'oat almond walnut lemon orange grape strawberry spinach carrot farm classic light premium natural'
+).split()
+FIRST_NAMES = 'Anna Ivan Maria Pavel Olga Dmitry Elena Sergey Natalia Alexey Irina Mikhail Yulia Andrey Sofia'.split()
+LAST_NAMES = 'Ivanov Petrov Smirnov Kuznetsov Popov Volkov Sokolov Lebedev Kozlov Novikov Morozov Orlov'.split()
+STREETS = 'Lenina Mira Sadovaya Gagarina Pushkina Lesnaya Shkolnaya Sovetskaya Zarechnaya Molodezhnaya'.split()
+UNITS = [('piece', '1'), ('kg', '1'), ('g', '500'), ('l', '1'), ('ml', '500'), ('pack', '1'), ('box', '1')]
+# Shelf life in days: perishables, mid-life goods and long-life goods
+SHELF_LIVES = [((3, 21), 40), ((30, 180), 30), ((180, 730), 30)]
+MAX_PRICE = 2000
+DESCRIPTION_POOL = 2000
+POPULARITY_EXPONENT = 0.9
+DELIVERED_SHARE = 0.75
+# Share of the products past their expiry date, by up to EXPIRED_DAYS days
+EXPIRED_SHARE = 0.1
+EXPIRED_DAYS = 30
+
+
+def mix(value):
+    # splitmix64 finalizer: a cheap, well spread hash of an integer
+    value = (value + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return value ^ (value >> 31)
+
+
+def get_price(seed, product_id):
+    """
+    Log-uniform price between 1 and MAX_PRICE, a pure function of the product
+    id so order chunks can price their products without reading them.
+    """
+    fraction = mix(seed * 0x1000003 + product_id) / 2 ** 64
+    return max(1, int(math.exp(fraction * math.log(MAX_PRICE))))
+
+
+def get_phone(customer_id):
+    return f'+7{customer_id:010d}'
+
+
+def get_popular_rank(rng, count):
+    """
+    Draw a rank in [0, count) from a bounded power law: rank 0 is the most
+    popular, and the popularity of rank r falls off like 1 / r ** exponent.
+    """
+    exponent = 1 - POPULARITY_EXPONENT
+    top = count ** exponent
+    return min(count - 1, int((1 + rng.random() * (top - 1)) ** (1 / exponent)) - 1)
+
+
+def get_stride(count):
+    # A stride coprime with count spreads popular ranks over the whole id range
+    stride = int(count * 0.618) | 1
+    while math.gcd(stride, count) != 1:
+        stride += 2
+    return stride
+
+
+def get_day_names(today, first, last):
+    # ISO dates by day offset from today, so rows carry strings the database takes as they are
+    return {offset: (today + datetime.timedelta(days=offset)).isoformat() for offset in range(first, last + 1)}
+
+
+def generate_customers(rng, ids, context):
+    birth_dates = get_day_names(context['today'], -80 * 365, -18 * 365)
+    for customer_id in ids:
+        # Most wallets are empty, the rest follow a long tail
+        wallet = 0 if rng.random() < 0.6 else min(100_000, int(rng.paretovariate(1.3) * 200))
+        yield (
+            customer_id, context['password'], False, f'customer{customer_id}@example.com',
+            rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), get_phone(customer_id),
+            birth_dates[rng.randint(-80 * 365, -18 * 365)], wallet, False, True, 0,
+        )
+
+
+def generate_manufacturers(rng, ids, context):
+    countries, now = context['countries'], str(context['now'])
+    for manufacturer_id in ids:
+        name = f'{rng.choice(WORDS).title()} {rng.choice(["Foods", "Farm", "Group", "Dairy", "Trade"])} {manufacturer_id}'
+        yield (
+            manufacturer_id, name, rng.choice(countries), f'{rng.randint(1, 200)} {rng.choice(STREETS)} st.',
+            f'info{manufacturer_id}@example.com', now,
+        )
+
+
+def generate_products(rng, ids, context):
+    # The hot loop of the generator: plain random() arithmetic instead of randint and weighted choices
+    random, choices = rng.random, rng.choices
+    manufacturers, categories, seed = context['manufacturers'], context['categories'], context['seed']
+    longest = max(high for (_, high), _ in SHELF_LIVES)
+    days = get_day_names(context['today'], -longest - EXPIRED_DAYS, longest)
+    shelf_lives = [days for days, _ in SHELF_LIVES]
+    shelf_cum_weights = list(itertools.accumulate(weight for _, weight in SHELF_LIVES))
+    category_cum_weights = list(itertools.accumulate(CATEGORY_WEIGHTS))
+    now, words = str(context['now']), len(WORDS)
+    # Descriptions are drawn from a per-chunk pool: building 8-20 words per row would dominate the run
+    descriptions = [' '.join(choices(WORDS, k=rng.randint(8, 20))) for _ in range(DESCRIPTION_POOL)]
+    for product_id in ids:
+        unit, value = UNITS[int(random() * len(UNITS))]
+        low, high = choices(shelf_lives, cum_weights=shelf_cum_weights)[0]
+        shelf_life = low + int(random() * (high - low + 1))
+        # Stock made within the last year is within its shelf life; EXPIRED_SHARE of it is past it
+        if random() < EXPIRED_SHARE:
+            expired = -1 - int(random() * EXPIRED_DAYS)
+            manufactured = expired - shelf_life
+        else:
+            manufactured = -int(random() * min(shelf_life, 365))
+            expired = manufactured + shelf_life
+        yield (
+            product_id,
+            ' '.join([WORDS[int(random() * words)] for _ in range(2 + (random() < 0.5))]),
+            descriptions[int(random() * DESCRIPTION_POOL)],
+            'products/generated.jpg', '{}',
+            manufacturers[int(random() * len(manufacturers))],
+            choices(categories, cum_weights=category_cum_weights)[0],
+            get_price(seed, product_id), value, unit, days[manufactured], days[expired], expired < 0, now,
+        )
+
+
+def generate_orders(rng, ids, context):
+    random = rng.random
+    first_product, products = context['products']
+    first_customer, customers = context['customers']
+    stride, now, seed = get_stride(products), context['now'], context['seed']
+    for order_id in ids:
+        product_id = first_product + get_popular_rank(rng, products) * stride % products
+        customer_id = first_customer + int(random() * customers)
+        quantity = min(10, int(rng.paretovariate(2.5)))
+        created_at = str(now - datetime.timedelta(seconds=int(random() * 365 * 24 * 60 * 60)))
+        yield (
+            order_id, product_id, quantity, customer_id, f'{1 + int(random() * 200)} {STREETS[int(random() * len(STREETS))]} st.',
+            get_phone(customer_id), get_price(seed, product_id) * quantity,
+            'delivery' if random() < DELIVERED_SHARE else 'not delivery', created_at, created_at,
+        )
+
+
+# Model, generator and the columns each generated tuple holds, in order
+TABLES = {
+    'customers': (Customer, generate_customers, [
+        'id', 'password', 'is_superuser', 'email', 'first_name', 'last_name', 'phone', 'birth_date', 'wallet',
+        'is_staff', 'is_active',
+    ]),
+    'manufacturers': (Manufacturer, generate_manufacturers, ['id', 'name', 'country', 'address', 'email', 'updated_at']),
+    'products': (Product, generate_products, [
+        'id', 'name', 'description', 'image', 'image_variants', 'manufacturer', 'category', 'price', 'value', 'unit',
+        'manufacturing_date', 'expired_date', 'is_expired', 'updated_at',
+    ]),
+    'orders': (Order, generate_orders, [
+        'id', 'product', 'quantity', 'customer', 'delivery_address', 'phone_customer', 'final_price', 'status',
+        'created_at', 'updated_at',
+    ]),
+}
+
+
+def generate_chunk(table, seed, start, count, context):
+    # Seeded per chunk, so the rows do not depend on how chunks are spread over processes
+    rng = random.Random(f'{seed}:{table}:{start}')
+    return list(TABLES[table][1](rng, range(start, start + count), context))
+
+
+def get_next_id(model):
+    return (model.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+
+@contextmanager
+def deferred_indexes(model):
+    """
+    On SQLite, drop the secondary indexes (and the product search triggers)
+    of ``model`` while loading and build them once at the end, which is much
+    faster than updating them row by row.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+            [model._meta.db_table],
+        )
+        indexes = cursor.fetchall()
+        triggers = model is Product and search.FTS_TABLE in connection.introspection.table_names(cursor)
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX "{name}"')
+        if triggers:
+            for sql in search.SQLITE_DROP[:len(search.SQLITE_TRIGGERS)]:
+                cursor.execute(sql)
+        yield
+        for _, sql in indexes:
+            cursor.execute(sql)
+        if triggers:
+            for sql in search.SQLITE_TRIGGERS:
+                cursor.execute(sql)
+            cursor.execute(search.SQLITE_REBUILD)
+
+
+class Generator:
+    """
+    Fill the database with synthetic customers, manufacturers, products and
+    orders, generated on a process pool and written with one prepared
+    ``INSERT`` per batch.
+
+    Rows get explicit ids following the current maximum, so products and
+    orders can reference ids that are still being generated by another
+    process. Output is deterministic for a given seed and day.
+    """
+    def __init__(self, seed=0, workers=None, password='password', log=print):
+        from django.contrib.auth.hashers import make_password
+
+        self.seed = seed
+        self.workers = workers if workers is not None else multiprocessing.cpu_count()
+        self.log = log
+        # One hash shared by every generated customer instead of one per row
+        self.password = make_password(password)
+        now = timezone.now()
+        if timezone.is_aware(now) and connection.vendor == 'sqlite':
+            now = timezone.make_naive(now, datetime.timezone.utc)
+        self.context = {'seed': seed, 'now': now, 'today': timezone.localdate(), 'password': self.password}
+
+    def run(self, customers, manufacturers, products, orders):
+        # Generated rows only reference rows generated in the same run
+        if products and not manufacturers:
+            raise ValueError('Generating products needs manufacturers')
+        if orders and not (products and customers):
+            raise ValueError('Generating orders needs products and customers')
+        self.context['countries'] = self.get_or_create(Country, COUNTRIES)
+        self.context['categories'] = self.get_or_create(Category, CATEGORIES)
+        self.context['customers'] = (self.load('customers', customers), customers)
+        first_manufacturer = self.load('manufacturers', manufacturers)
+        self.context['manufacturers'] = list(range(first_manufacturer, first_manufacturer + manufacturers))
+        self.context['products'] = (self.load('products', products), products)
+        self.load('orders', orders)
+
+        for model in (Category, Country, Manufacturer, Product, Order):
+            bump_version(model)
+        self.reset_sequences()
+
+    def get_or_create(self, model, names):
+        existing = dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+        model.objects.bulk_create([model(name=name) for name in names if name not in existing])
+        return list(model.objects.filter(name__in=names).values_list('id', flat=True))
+
+    def load(self, table, count):
+        model, _, fields = TABLES[table]
+        start = get_next_id(model)
+        if not count:
+            return start
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in fields)
+        sql = f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({", ".join(["%s"] * len(fields))})'
+        chunks = [(table, self.seed, offset, min(CHUNK_SIZE, start + count - offset), self.context)
+                  for offset in range(start, start + count, CHUNK_SIZE)]
+
+        written = 0
+        started = time.perf_counter()
+        with transaction.atomic(), deferred_indexes(model), connection.cursor() as cursor:
+            for rows in self.generate(chunks):
+                cursor.executemany(sql, rows)
+                written += len(rows)
+                self.log(f'{table}: {written}/{count}')
+        self.log(f'{table}: {count} rows in {time.perf_counter() - started:.1f}s')
+        return start
+
+    def generate(self, chunks):
+        if self.workers <= 1 or len(chunks) == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return (generate_chunk(*chunk) for chunk in chunks)
+        # Forked workers inherit the loaded Django app and never touch the database
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        return self.drain(pool, pool.map(generate_chunk, *zip(*chunks)))
+
+    def drain(self, pool, results):
+        with pool:
+            yield from results
+
+    def reset_sequences(self):
+        # Explicit ids leave PostgreSQL sequences behind
+        statements = connection.ops.sequence_reset_sql(no_style(), [Customer, Manufacturer, Product, Order])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
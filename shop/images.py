@@ -0,0 +1,163 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import Product
+from .storage import acquire, get_variant_names, release
+
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each derivative
+VARIANTS = {
+    'thumb': 160,
+    'medium': 640,
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+VARIANT_DIR = 'variants'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'SHOP_IMAGE_WORKERS', 2))
+        return _pool
+
+
+def render_variants(source):
+    """
+    Decode the image at ``source`` (a path or the raw bytes) and encode every
+    variant in every format. Runs in a pool worker, so it only touches Pillow.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        rendered = {}
+        for variant, size in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            encoded = {}
+            for name, options in FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, **options)
+                encoded[name] = buffer.getvalue()
+            rendered[variant] = {'width': resized.width, 'height': resized.height, 'files': encoded}
+        return rendered
+
+
+def get_variant_name(image_name, variant, extension):
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, VARIANT_DIR, f'{stem}.{variant}.{extension}')
+
+
+def store_variants(product_id, image_name, rendered):
+    """
+    Save rendered variants next to the original and record them on the
+    product, unless its image was replaced in the meantime.
+    """
+    variants = {'source': image_name}
+    for variant, data in rendered.items():
+        variants[variant] = {'width': data['width'], 'height': data['height']}
+        for extension, content in data['files'].items():
+            # Content-addressed names are shared by identical files, so an existing one is never deleted here
+            name = get_variant_name(image_name, variant, extension)
+            variants[variant][extension] = default_storage.save(name, ContentFile(content))
+
+    names = get_variant_names(image_name, variants)
+    with transaction.atomic():
+        acquire(*names)
+        previous = list(Product.objects.select_for_update().filter(id=product_id, image=image_name).values_list(
+            'image_variants', flat=True
+        ))
+        if not previous:
+            # Nothing references the new files; they are deleted unless another product shares them
+            release(*names)
+            return 0
+        Product.objects.filter(id=product_id).update(image_variants=variants, updated_at=timezone.now())
+        release(*get_variant_names(image_name, previous[0]))
+    bump_version(Product)
+    return 1
+
+
+def get_source(image_name):
+    try:
+        return default_storage.path(image_name)
+    except NotImplementedError:
+        with default_storage.open(image_name, 'rb') as file:
+            return file.read()
+
+
+def submit_variants(product_id, image_name):
+    """
+    Render the variants of ``image_name`` on the process pool and store them
+    from the pool's result thread. Returns a future that resolves to the
+    number of products updated.
+
+    With ``SHOP_IMAGE_WORKERS = 0`` the work runs inline instead.
+    """
+    result = Future()
+    source = get_source(image_name)
+    if not getattr(settings, 'SHOP_IMAGE_WORKERS', 2):
+        try:
+            result.set_result(store_variants(product_id, image_name, render_variants(source)))
+        except Exception as error:
+            result.set_exception(error)
+        return result
+
+    def done(rendering):
+        close_old_connections()
+        try:
+            result.set_result(store_variants(product_id, image_name, rendering.result()))
+        except Exception as error:
+            logger.exception('Could not create image variants for product %s', product_id)
+            result.set_exception(error)
+
+    get_pool().submit(render_variants, source).add_done_callback(done)
+    return result
+
+
+def queue_variants(product):
+    # Queue only once the new image is committed, so the worker never sees a rolled back upload
+    if product.image:
+        transaction.on_commit(lambda: submit_variants(product.id, product.image.name))
+
+
+def get_variant_urls(product):
+    """
+    Return ``(variants, srcset)`` for the product's current image:
+    ``{variant: {format: url}}`` and ``{format: 'url 160w, url 640w'}``.
+    Both are empty until the variants of the current image exist.
+    """
+    variants = product.image_variants or {}
+    if not product.image or variants.get('source') != product.image.name:
+        return {}, {}
+    urls, srcset = {}, {}
+    for variant in VARIANTS:
+        if variant not in variants:
+            continue
+        urls[variant] = {}
+        for extension in FORMATS:
+            url = default_storage.url(variants[variant][extension])
+            urls[variant][extension] = url
+            srcset.setdefault(extension, []).append(f'{url} {variants[variant]["width"]}w')
+    return urls, {extension: ', '.join(entries) for extension, entries in srcset.items()}
@@ -0,0 +1,164 @@
+import codecs
+import csv
+import json
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .analytics import move_products
+from .cache import bump_version
+from .models import Category, Manufacturer, Product
+from .storage import acquire, get_variant_names, release
+from .serializers import ProductsImportSerializer
+
+
+UPDATE_FIELDS = [
+    'name', 'description', 'manufacturer', 'category', 'price', 'value', 'unit',
+    'manufacturing_date', 'expired_date', 'is_expired', 'updated_at',
+]
+
+
+def read_csv(lines):
+    for row in csv.DictReader(codecs.iterdecode(lines, 'utf-8')):
+        yield {key: value for key, value in row.items() if value != ''}
+
+
+def read_ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonlines': 'ndjson',
+}
+
+
+class ProductImporter:
+    """
+    Validate and upsert a stream of product rows in batches.
+
+    Rows are validated with the ``ProductsCreateSerializer`` rules, manufacturer
+    and category names are resolved from maps loaded once up front, and each
+    batch is written with ``bulk_create`` and ``bulk_update`` in one transaction. A row
+    updates an existing product when it carries its ``id`` or matches one on
+    manufacturer and name.
+    """
+    batch_size = 1000
+    max_errors = 1000
+
+    def __init__(self, batch_size=None, max_errors=None):
+        self.batch_size = batch_size or self.batch_size
+        self.max_errors = max_errors if max_errors is not None else self.max_errors
+        self.serializer = ProductsImportSerializer(context={
+            'manufacturers': self.load_map(Manufacturer),
+            'categories': self.load_map(Category),
+        })
+        self.report = {'created': 0, 'updated': 0, 'error_count': 0, 'errors': []}
+
+    def load_map(self, model):
+        names = {}
+        for pk, name in model.objects.values_list('id', 'name'):
+            names[name] = pk
+            names.setdefault(str(pk), pk)
+        return names
+
+    def run(self, rows):
+        batch = []
+        for number, row in enumerate(rows, start=1):
+            product = self.validate(number, row)
+            if product is not None:
+                batch.append((number, product))
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        self.report['errors'].sort(key=lambda error: error['row'])
+        return self.report
+
+    def validate(self, number, row):
+        if not isinstance(row, dict):
+            self.add_error(number, {'non_field_errors': ['Row is not a valid object']})
+            return None
+        try:
+            data = self.serializer.run_validation(row)
+        except serializers.ValidationError as error:
+            self.add_error(number, error.detail)
+            return None
+        return Product(**data)
+
+    def add_error(self, number, detail):
+        self.report['error_count'] += 1
+        if len(self.report['errors']) < self.max_errors:
+            self.report['errors'].append({'row': number, 'errors': detail})
+
+    def write(self, batch):
+        ids = {product.id for _, product in batch if product.id is not None}
+        found = set(Product.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+        names = {(product.manufacturer_id, product.name) for _, product in batch if product.id is None}
+        existing = {}
+        if names:
+            matches = Product.objects.filter(
+                manufacturer_id__in={manufacturer for manufacturer, _ in names},
+                name__in={name for _, name in names},
+            ).values_list('manufacturer_id', 'name', 'id')
+            existing = {(manufacturer, name): pk for manufacturer, name, pk in matches}
+
+        now = timezone.now()
+        today = timezone.localdate()
+        to_create, to_update, to_update_image = {}, {}, {}
+        for number, product in batch:
+            product.set_expired(today)
+            if product.id is not None and product.id not in found:
+                self.add_error(number, {'id': [f'Product {product.id} does not exist']})
+                continue
+            if product.id is None:
+                product.id = existing.get((product.manufacturer_id, product.name))
+            if product.id is None:
+                # A product repeated within one batch keeps its last row
+                to_create[(product.manufacturer_id, product.name)] = product
+                continue
+            product.updated_at = now
+            to_update.pop(product.id, None)
+            to_update_image.pop(product.id, None)
+            (to_update_image if product.image else to_update)[product.id] = product
+
+        with transaction.atomic():
+            self.track_changes(to_create.values(), {**to_update, **to_update_image})
+            Product.objects.bulk_create(list(to_create.values()), batch_size=self.batch_size)
+            Product.objects.bulk_update(list(to_update.values()), UPDATE_FIELDS, batch_size=self.batch_size)
+            Product.objects.bulk_update(list(to_update_image.values()), UPDATE_FIELDS + ['image'], batch_size=self.batch_size)
+        # Bulk writes send no post_save
+        bump_version(Product)
+        self.report['created'] += len(to_create)
+        self.report['updated'] += len(to_update) + len(to_update_image)
+
+    def track_changes(self, created, updated):
+        # Bulk writes send no signals, so blob references and sales summaries are kept here
+        acquire(*(product.image.name for product in created if product.image))
+        previous = Product.objects.select_for_update().filter(id__in=updated).values_list(
+            'id', 'image', 'image_variants', 'category_id', 'manufacturer_id'
+        )
+        moved = {}
+        for product_id, image, variants, category_id, manufacturer_id in previous:
+            product = updated[product_id]
+            if product.image and image != product.image.name:
+                acquire(product.image.name)
+                release(image, *get_variant_names(image, variants))
+            moved[product_id] = ((category_id, manufacturer_id), (product.category_id, product.manufacturer_id))
+        move_products(moved)
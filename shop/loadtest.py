@@ -0,0 +1,245 @@
+import io
+import itertools
+import json
+import resource
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from wsgiref.util import setup_testing_defaults
+
+from django.db import connections
+
+from .authentication import issue_token
+from .metrics import Timings
+from .models import *
+
+
+# Rows per preset: (products, orders)
+DATASETS = {
+    'small': (1_000, 10_000),
+    'medium': (100_000, 1_000_000),
+    'large': (1_000_000, 10_000_000),
+}
+PASSWORD = 'benchmark-password'
+
+
+class Fixtures:
+    """
+    The ids, users and tokens the scenarios need, read from the current data.
+    """
+    def __init__(self):
+        self.customer = self.get_customer('loadtest@example.com', 'loadtest', is_staff=False)
+        self.staff = self.get_customer('loadtest-staff@example.com', 'loadtest-staff', is_staff=True)
+        self.token = issue_token(self.customer)
+        self.staff_token = issue_token(self.staff)
+        self.product = Product.objects.order_by('id').values_list('id', flat=True).first()
+        self.category = Category.objects.order_by('id').values_list('id', flat=True).first()
+        self.manufacturer = Manufacturer.objects.order_by('id').values_list('id', flat=True).first()
+        self.country = Country.objects.order_by('id').values_list('id', flat=True).first()
+        if None in (self.product, self.category, self.manufacturer, self.country):
+            raise ValueError('The database needs at least one product, category, manufacturer and country')
+        if not Order.objects.filter(customer=self.customer).exists():
+            Order.objects.create(product_id=self.product, customer=self.customer, delivery_address='-')
+        self.order = Order.objects.filter(customer=self.customer).values_list('id', flat=True).first()
+        self.import_rows = self.get_import_rows()
+        self.counter = itertools.count()
+
+    def get_customer(self, email, phone, is_staff):
+        customer = Customer.objects.filter(email=email).first()
+        if customer is None:
+            customer = Customer.objects.create_user(email, PASSWORD, phone=phone, is_staff=is_staff)
+        # Enough for every order the run places to be paid from the wallet
+        Customer.objects.filter(pk=customer.pk).update(wallet=10 ** 9)
+        return customer
+
+    def get_sign_out_token(self):
+        # Signing out revokes every token of a customer, and the requests are built
+        # before any is sent, so each one signs out a customer of its own
+        number = f'{time.time_ns() % 10 ** 7}-{self.unique()}'
+        customer = Customer.objects.create(email=f'loadtest-sign-out-{number}@example.com', phone=f'so{number}')
+        return issue_token(customer)
+
+    def get_import_rows(self):
+        rows = Product.objects.order_by('id').values(
+            'id', 'name', 'manufacturer_id', 'category_id', 'price', 'value', 'unit',
+            'manufacturing_date', 'expired_date',
+        )[:10]
+        lines = []
+        for row in rows:
+            category_id = row.pop('category_id')
+            row['manufacturer'] = str(row.pop('manufacturer_id'))
+            row['category'] = str(category_id) if category_id else None
+            row['value'] = str(row['value'])
+            lines.append(json.dumps(row, default=str))
+        return ('\n'.join(lines) + '\n').encode()
+
+    def unique(self):
+        return next(self.counter)
+
+
+def get(path, token=None):
+    return lambda fixtures: {
+        'method': 'GET', 'path': path.format(fixtures=fixtures), 'token': token and getattr(fixtures, token),
+    }
+
+
+def post_json(path, body, token=None):
+    return lambda fixtures: {
+        'method': 'POST', 'path': path, 'token': token and getattr(fixtures, token),
+        'content_type': 'application/json', 'body': json.dumps(body(fixtures)).encode(),
+    }
+
+
+# A request builder per shop/urls.py route, keyed on the route pattern; ``token``
+# names the Fixtures token sent in the Authorization header. Heavy ones run fewer requests.
+SCENARIOS = {
+    'category': get('/api/category'),
+    'category/<int:pk>': get('/api/category/{fixtures.category}'),
+    'products': get('/api/products?page_size=100'),
+    'products/<int:pk>': get('/api/products/{fixtures.product}'),
+    'products/import': lambda fixtures: {
+        'method': 'POST', 'path': '/api/products/import', 'token': fixtures.staff_token,
+        'content_type': 'application/x-ndjson', 'body': fixtures.import_rows,
+    },
+    'products/export': get('/api/products/export?format=ndjson', 'staff_token'),
+    'products/expiring': get('/api/products/expiring?days=30'),
+    'products/expiring/categories': get('/api/products/expiring/categories?days=30'),
+    'manufacturer': get('/api/manufacturer'),
+    'manufacturer/<int:pk>': get('/api/manufacturer/{fixtures.manufacturer}'),
+    'сountry': get('/api/сountry'),
+    'сountry/<int:pk>': get('/api/сountry/{fixtures.country}'),
+    'orders': get('/api/orders', 'token'),
+    'orders/<int:pk>': get('/api/orders/{fixtures.order}', 'token'),
+    'orders/export': get('/api/orders/export?format=ndjson', 'staff_token'),
+    'orders/checkout': post_json('/api/orders/checkout', lambda fixtures: {
+        'items': [{'product': fixtures.product, 'quantity': 1}], 'delivery_address': '-',
+    }, 'token'),
+    'cache': get('/api/cache', 'staff_token'),
+    'metrics': get('/api/metrics', 'staff_token'),
+    'analytics/sales/<str:dimension>': get('/api/analytics/sales/category?group=total', 'staff_token'),
+    'sign_in': post_json('/api/sign_in', lambda fixtures: {'username': fixtures.customer.email, 'password': PASSWORD}),
+    'sign_out': lambda fixtures: {'method': 'GET', 'path': '/api/sign_out', 'token': fixtures.get_sign_out_token()},
+    'profile': get('/api/profile', 'token'),
+    'sign_up': post_json('/api/sign_up', lambda fixtures: {
+        'email': f'loadtest-{time.time_ns()}-{fixtures.unique()}@example.com', 'password': PASSWORD,
+        'phone': f'lt{time.time_ns() % 10 ** 12}', 'first_name': 'Load', 'last_name': 'Test',
+    }),
+    '^swagger\\.(?P<format>json|yaml)$': get('/api/swagger.json'),
+    'swagger/': get('/api/swagger/'),
+    'redoc/': get('/api/redoc/'),
+}
+HEAVY = {'products/export', 'orders/export', 'products/import', 'sign_in', 'sign_up', '^swagger\\.(?P<format>json|yaml)$'}
+
+
+def get_routes():
+    from .urls import urlpatterns
+
+    return [str(pattern.pattern) for pattern in urlpatterns]
+
+
+def build_environ(spec):
+    path, _, query = spec['path'].partition('?')
+    body = spec.get('body', b'')
+    environ = {
+        'REQUEST_METHOD': spec['method'],
+        # WSGI carries the path as latin-1 decoded bytes
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': query,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'HTTP_ACCEPT': spec.get('accept', '*/*'),
+    }
+    if spec.get('content_type'):
+        environ['CONTENT_TYPE'] = spec['content_type']
+    if spec.get('token'):
+        environ['HTTP_AUTHORIZATION'] = f'Bearer {spec["token"]}'
+    setup_testing_defaults(environ)
+    return environ
+
+
+def call(app, environ):
+    """
+    Run one request through ``app`` and drain the body.
+    Returns ``(status, seconds, queries)``.
+    """
+    timings = Timings()
+    statuses = []
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings))
+        response = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            for _ in response:
+                pass
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+    return int(statuses[0][:3]), time.perf_counter() - started, timings.queries
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scenario(app, fixtures, scenario, requests, concurrency, warmup):
+    """
+    Send ``requests`` requests of ``scenario`` from ``concurrency`` threads
+    and summarize latency, throughput, query counts and peak memory.
+    """
+    for _ in range(warmup):
+        call(app, build_environ(scenario(fixtures)))
+
+    # Built up front so issuing tokens and encoding bodies stays out of the timings
+    environs = [build_environ(scenario(fixtures)) for _ in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda environ: call(app, environ), environs))
+    elapsed = time.perf_counter() - started
+
+    latencies = [seconds * 1000 for _, seconds, _ in results]
+    queries = [count for _, _, count in results]
+    statuses = {}
+    for code, _, _ in results:
+        statuses[str(code)] = statuses.get(str(code), 0) + 1
+    return {
+        'requests': requests,
+        'statuses': statuses,
+        'errors': sum(count for code, count in statuses.items() if code.startswith('5')),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'mean_ms': statistics.fmean(latencies),
+        'requests_per_second': requests / elapsed,
+        'queries_mean': statistics.fmean(queries),
+        'queries_max': max(queries),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    List the routes whose p95 latency grew by more than ``threshold`` (a
+    fraction) or whose mean query count grew, relative to ``baseline``.
+    """
+    regressions = []
+    for route, current in results['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous:
+            continue
+        if set(current['statuses']) != set(previous['statuses']):
+            # Different responses are not comparable by latency
+            regressions.append(f'{route}: statuses {previous["statuses"]} -> {current["statuses"]}')
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f'{route}: p95 {previous["p95_ms"]:.1f} -> {current["p95_ms"]:.1f} ms')
+        if current['queries_mean'] > previous['queries_mean'] + 0.5:
+            regressions.append(f'{route}: queries {previous["queries_mean"]:.1f} -> {current["queries_mean"]:.1f}')
+    return regressions
@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+from django.db.models.fields.json import KeyTextTransform
+
+from shop.images import submit_variants
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Renders the thumbnail and medium variants of product images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render variants that already exist')
+        parser.add_argument('--batch-size', type=int, default=100, help='Images in flight at once')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').annotate(
+            variant_source=KeyTextTransform('source', 'image_variants')
+        ).values_list('id', 'image', 'variant_source').order_by('id')
+
+        started = time.perf_counter()
+        done = failed = skipped = 0
+        pending = []
+        for product_id, image, variant_source in products.iterator():
+            if variant_source == image and not options['all']:
+                skipped += 1
+                continue
+            try:
+                pending.append(submit_variants(product_id, image))
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'product {product_id}: {error}')
+            if len(pending) >= options['batch_size']:
+                finished, failures = self.collect(pending)
+                done, failed, pending = done + finished, failed + failures, []
+        finished, failures = self.collect(pending)
+        done, failed = done + finished, failed + failures
+
+        self.stdout.write(f'rendered {done} images, {failed} failed, {skipped} already up to date '
+                          f'in {time.perf_counter() - started:.1f}s')
+
+    def collect(self, futures):
+        wait(futures)
+        failures = 0
+        for future in futures:
+            if future.exception() is not None:
+                failures += 1
+                self.stderr.write(str(future.exception()))
+        return len(futures) - failures, failures
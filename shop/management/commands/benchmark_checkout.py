@@ -0,0 +1,89 @@
+import datetime
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIClient
+
+from shop.models import *
+
+
+class Command(BaseCommand):
+    help = 'Runs parallel checkouts against /api/orders and verifies the wallet balance afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=200, help='Orders per worker')
+        parser.add_argument('--wallet', type=int, default=10000)
+        parser.add_argument('--price', type=int, default=7)
+
+    def handle(self, *args, **options):
+        customer, product = self.create_fixtures(options)
+        try:
+            self.run(customer, product, options)
+        finally:
+            Order.objects.filter(customer=customer).delete()
+            manufacturer, country, category = product.manufacturer, product.manufacturer.country, product.category
+            product.delete()
+            manufacturer.delete()
+            country.delete()
+            category.delete()
+            customer.delete()
+
+    def create_fixtures(self, options):
+        country = Country.objects.create(name='Checkout benchmark')
+        category = Category.objects.create(name='Checkout benchmark')
+        manufacturer = Manufacturer.objects.create(
+            name='Checkout benchmark', country=country, address='-', email='bench@example.com'
+        )
+        today = datetime.date.today()
+        product = Product.objects.create(
+            name='Checkout benchmark', image='products/benchmark.jpg', manufacturer=manufacturer,
+            category=category, price=options['price'], value=1, unit='piece',
+            manufacturing_date=today, expired_date=today,
+        )
+        customer = Customer.objects.create(
+            email='checkout-benchmark@example.com', phone='checkout-bench', wallet=options['wallet']
+        )
+        return customer, product
+
+    def run(self, customer, product, options):
+        results = {'created': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def worker():
+            client = APIClient()
+            client.force_authenticate(customer)
+            created = failed = 0
+            try:
+                for _ in range(options['orders']):
+                    response = client.post('/api/orders', {'product': product.id, 'delivery_address': '-'})
+                    if response.status_code == 201:
+                        created += 1
+                    else:
+                        failed += 1
+            finally:
+                connection.close()
+            with lock:
+                results['created'] += created
+                results['failed'] += failed
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        orders = Order.objects.filter(customer=customer)
+        paid = sum(product.price - final_price for final_price in orders.values_list('final_price', flat=True))
+        wallet = Customer.objects.values_list('wallet', flat=True).get(pk=customer.pk)
+
+        self.stdout.write(f'{results["created"]} orders ({results["failed"]} failed) by {options["workers"]} workers '
+                          f'in {elapsed:.2f}s: {results["created"] / elapsed:.0f} orders/s')
+        self.stdout.write(f'wallet {options["wallet"]} -> {wallet}, paid from wallet {paid}')
+        if orders.count() != results['created'] or wallet < 0 or options['wallet'] - paid != wallet:
+            raise CommandError('Wallet balance does not match the orders placed')
+        self.stdout.write('wallet balance is consistent')
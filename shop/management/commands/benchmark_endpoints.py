@@ -0,0 +1,115 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from shop.analytics import rebuild_summaries
+from shop.benchmark import seed_data
+from shop.loadtest import DATASETS, HEAVY, SCENARIOS, Fixtures, compare, get_routes, run_scenario
+from shop.models import *
+
+
+class Command(BaseCommand):
+    help = ('Drives every shop route through the WSGI app at a fixed concurrency and writes latency, '
+            'throughput, query and memory figures as JSON. Seeds an empty database first; '
+            'point DATABASE_URL at a scratch database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=DATASETS, default='small', help='Rows to seed an empty database with')
+        parser.add_argument('--products', type=int, help='Override the product count of the dataset')
+        parser.add_argument('--orders', type=int, help='Override the order count of the dataset')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+        parser.add_argument('--heavy-requests', type=int, default=10, help='Requests per export, import, sign in/up and schema route')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per route')
+        parser.add_argument('--output', default=os.path.join(settings.BASE_DIR, 'reports', 'benchmark-results.json'),
+                            help='Defaults to reports/benchmark-results.json, which git ignores')
+        parser.add_argument('--compare', help='Results of an earlier run; fail on regressions against it')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p95 growth over --compare')
+        parser.add_argument('routes', nargs='*', help='Only these route patterns')
+
+    def handle(self, *args, **options):
+        products, orders = DATASETS[options['dataset']]
+        products = options['products'] if options['products'] is not None else products
+        orders = options['orders'] if options['orders'] is not None else orders
+        self.seed(products, orders, options['seed'])
+
+        routes = get_routes()
+        missing = [route for route in routes if route not in SCENARIOS]
+        if missing:
+            raise CommandError(f'No benchmark scenario for: {", ".join(missing)}')
+        selected = options['routes'] or routes
+        unknown = set(selected) - set(routes)
+        if unknown:
+            raise CommandError(f'Unknown routes: {", ".join(sorted(unknown))}')
+
+        from api.wsgi import app
+
+        fixtures = Fixtures()
+        results = {
+            'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'environment': self.get_environment(),
+            'dataset': {
+                'products': Product.objects.count(),
+                'orders': Order.objects.count(),
+                'customers': Customer.objects.count(),
+            },
+            'concurrency': options['concurrency'],
+            'routes': {},
+        }
+        self.stdout.write(f'{"route":<36} {"req":>5} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"req/s":>8} {"queries":>8}  statuses')
+        for route in selected:
+            requests = options['heavy_requests'] if route in HEAVY else options['requests']
+            summary = run_scenario(app, fixtures, SCENARIOS[route], requests, options['concurrency'], options['warmup'])
+            results['routes'][route] = summary
+            self.stdout.write(
+                f'{route:<36} {requests:>5} {summary["p50_ms"]:>9.1f} {summary["p95_ms"]:>9.1f} {summary["p99_ms"]:>9.1f} '
+                f'{summary["requests_per_second"]:>8.1f} {summary["queries_mean"]:>8.1f}  {summary["statuses"]}'
+            )
+
+        os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+        with open(options['output'], 'w') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write(f'peak RSS {max(summary["peak_rss_mb"] for summary in results["routes"].values()):.1f} MiB; '
+                          f'results written to {options["output"]}')
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                regressions = compare(results, json.load(file), options['threshold'])
+            if regressions:
+                raise CommandError('Regressions:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(f'no regressions against {options["compare"]}')
+
+    def seed(self, products, orders, seed):
+        # Data is only generated into an empty database, so a run is repeatable from scratch
+        if Product.objects.exists():
+            self.stdout.write('database already has products, benchmarking the existing data')
+            return
+        elapsed = seed_data(products, orders, seed=seed)
+        self.stdout.write(f'seeded {products} products and {orders} orders in {elapsed:.1f}s')
+        started = time.perf_counter()
+        rebuild_summaries()
+        self.stdout.write(f'rebuilt sales summaries in {time.perf_counter() - started:.1f}s')
+
+    def get_environment(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'metrics_middleware': getattr(settings, 'SHOP_METRICS', False),
+        }
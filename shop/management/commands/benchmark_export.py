@@ -0,0 +1,46 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from shop.benchmark import rolled_back, seed_products
+from shop.models import *
+
+
+class Command(BaseCommand):
+    help = 'Streams the product export and reports throughput and peak RSS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many synthetic products first')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded products instead of rolling back')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+
+    def handle(self, *args, **options):
+        with rolled_back(options['keep']):
+            if options['seed']:
+                elapsed = seed_products(options['seed'])
+                self.stdout.write(f'seeded {options["seed"]} products in {elapsed:.1f}s')
+            self.run(options)
+
+    def run(self, options):
+        staff = Customer(email='benchmark@example.com', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+
+        rss_before = self.peak_rss_mb()
+        started = time.perf_counter()
+        response = client.get(f'/api/products/export?format={options["format"]}')
+        size = lines = 0
+        for chunk in response.streaming_content:
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'exported {lines} lines, {size / 2 ** 20:.1f} MiB in {elapsed:.1f}s '
+                          f'({lines / elapsed:,.0f} lines/s)')
+        self.stdout.write(f'peak RSS before export {rss_before:.1f} MiB, after export {self.peak_rss_mb():.1f} MiB')
+
+    def peak_rss_mb(self):
+        # ru_maxrss is reported in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from shop.benchmark import rolled_back, seed_products
+from shop.models import *
+from shop.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from shop.serializers import PRODUCT_FIELDS, ProductsSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares the encode time per 10k products of the JSON, fast JSON and MessagePack renderers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many synthetic products first')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded products instead of rolling back')
+        parser.add_argument('--rows', type=int, default=10000, help='Products serialized and encoded per run')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--fields', help='Comma separated fields, as in ?fields=')
+
+    def handle(self, *args, **options):
+        with rolled_back(options['keep']):
+            if options['seed']:
+                elapsed = seed_products(options['seed'])
+                self.stdout.write(f'seeded {options["seed"]} products in {elapsed:.1f}s')
+            self.run(options)
+
+    def run(self, options):
+        fields = options['fields'].split(',') if options['fields'] else None
+        unknown = set(fields or []) - set(PRODUCT_FIELDS)
+        if unknown:
+            raise CommandError(f'Unknown fields: {", ".join(sorted(unknown))}')
+
+        products = list(Product.objects.select_related('manufacturer', 'category').order_by('id')[:options['rows']])
+        if not products:
+            raise CommandError('There are no products; pass --seed')
+        # Encoded as the list view sends it, so only the renderers are timed
+        data = {'next': None, 'previous': None, 'results': ProductsSerializer(products, many=True, fields=fields).data}
+
+        renderers = [('JSONRenderer', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('FastJSONRenderer (orjson)', FastJSONRenderer()))
+        else:
+            self.stdout.write('orjson is not installed, skipping FastJSONRenderer')
+        if msgpack is not None:
+            renderers.append(('MessagePackRenderer', MessagePackRenderer()))
+        else:
+            self.stdout.write('msgpack is not installed, skipping MessagePackRenderer')
+
+        rows = len(products)
+        self.stdout.write(f'{rows} products, best of {options["repeat"]} runs (encoding only)')
+        self.stdout.write(f'{"renderer":<28} {"ms/10k":>9} {"bytes/row":>10}')
+        baseline = None
+        for name, renderer in renderers:
+            elapsed, size = min(self.measure(renderer, data) for _ in range(options['repeat']))
+            per_10k = elapsed * 10000 / rows
+            baseline = baseline or per_10k
+            self.stdout.write(f'{name:<28} {per_10k * 1000:>9.1f} {size / rows:>10.0f}  {baseline / per_10k:.1f}x')
+
+    def measure(self, renderer, data):
+        started = time.perf_counter()
+        content = renderer.render(data, renderer.media_type, {})
+        return time.perf_counter() - started, len(content)
@@ -0,0 +1,46 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.startup import run_probe
+
+
+MODES = {
+    'live': '0',
+    'prebuilt': '1',
+}
+
+
+class Command(BaseCommand):
+    help = 'Measures cold start and first docs/API requests with a live vs a prebuilt OpenAPI schema'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('paths', nargs='*', default=['/', '/api/swagger.json', '/api/category'])
+
+    def handle(self, *args, **options):
+        results = {}
+        for mode, flag in MODES.items():
+            runs = [self.probe({'SHOP_PREBUILT_SCHEMA': flag}, options['paths']) for _ in range(options['runs'])]
+            results[mode] = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+
+        for mode, timings in results.items():
+            self.stdout.write(f'== {mode} (median of {options["runs"]} cold starts)')
+            for key, elapsed in timings.items():
+                self.stdout.write(f'   {key:<32} {elapsed:8.1f} ms')
+        saved = results['live']['total'] - results['prebuilt']['total']
+        self.stdout.write(f'prebuilt schema saves {saved:.1f} ms per cold start')
+
+    def probe(self, env, paths):
+        started = time.perf_counter()
+        try:
+            timings, _ = run_probe(paths, env)
+        except RuntimeError as error:
+            raise CommandError(str(error))
+        total = time.perf_counter() - started
+        result = {'load': timings.pop('load')}
+        for path, timing in timings.items():
+            result[f'{timing["status"]} {path}'] = timing['seconds']
+        result['total'] = total
+        return result
@@ -0,0 +1,43 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.benchmark import rolled_back, seed_products
+from shop.models import *
+from shop.search import like_search, search_products
+
+
+class Command(BaseCommand):
+    help = 'Compares the LIKE and full-text product search paths on the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many synthetic products first')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded products instead of rolling back')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('terms', nargs='*', default=['milk', 'organic whole', 'choc', 'strawberry yogurt'])
+
+    def handle(self, *args, **options):
+        with rolled_back(options['keep']):
+            if options['seed']:
+                elapsed = seed_products(options['seed'])
+                self.stdout.write(f'seeded {options["seed"]} products in {elapsed:.1f}s')
+            self.run(options)
+
+    def run(self, options):
+        products = Product.objects.all()
+        self.stdout.write(f'{Product.objects.count()} products, {options["repeat"]} runs per term')
+        self.stdout.write(f'{"term":<24} {"like ms":>10} {"fts ms":>10} {"speedup":>8}')
+        for term in options['terms']:
+            like_ms = self.measure(lambda: like_search(products, term).order_by('id'), options)
+            fts_ms = self.measure(lambda: search_products(products, term), options)
+            self.stdout.write(f'{term:<24} {like_ms:>10.2f} {fts_ms:>10.2f} {like_ms / fts_ms:>7.1f}x')
+
+    def measure(self, build, options):
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            list(build()[:options['page_size']])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.benchmark import rolled_back, seed_products
+from shop.models import *
+from shop.serializers import PRODUCT_FIELDS, ProductsSerializer, project_products, serialize_products
+
+
+class Command(BaseCommand):
+    help = 'Compares product rows per second of the full ModelSerializer path and of ?fields= projections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many synthetic products first')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded products instead of rolling back')
+        parser.add_argument('--rows', type=int, default=10000, help='Products fetched and rendered per run')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('fields', nargs='*', default=['id,name,price', 'id,name,manufacturer,category,price,image'])
+
+    def handle(self, *args, **options):
+        with rolled_back(options['keep']):
+            if options['seed']:
+                elapsed = seed_products(options['seed'])
+                self.stdout.write(f'seeded {options["seed"]} products in {elapsed:.1f}s')
+            self.run(options)
+
+    def run(self, options):
+        products = Product.objects.select_related('manufacturer', 'category').order_by('id')
+        rows = min(options['rows'], products.count())
+        if not rows:
+            raise CommandError('There are no products; pass --seed')
+
+        def model_serializer(fields):
+            return lambda: ProductsSerializer(list(products[:rows]), many=True, fields=fields).data
+
+        def projected(fields):
+            return lambda: serialize_products(list(project_products(products, fields)[:rows]), fields)
+
+        cases = [('all fields, ModelSerializer', model_serializer(None))]
+        for value in options['fields']:
+            fields = value.split(',')
+            unknown = set(fields) - set(PRODUCT_FIELDS)
+            if unknown:
+                raise CommandError(f'Unknown fields: {", ".join(sorted(unknown))}')
+            cases.append((f'{value}, ModelSerializer', model_serializer(fields)))
+            cases.append((f'{value}, projected', projected(fields)))
+
+        self.stdout.write(f'{rows} rows, best of {options["repeat"]} runs (query and rendering)')
+        self.stdout.write(f'{"case":<56} {"ms":>9} {"rows/s":>12}')
+        baseline = None
+        for name, render in cases:
+            elapsed = min(self.measure(render) for _ in range(options['repeat']))
+            baseline = baseline or elapsed
+            self.stdout.write(f'{name:<56} {elapsed * 1000:>9.1f} {rows / elapsed:>12,.0f}  {baseline / elapsed:.1f}x')
+
+    def measure(self, render):
+        started = time.perf_counter()
+        render()
+        return time.perf_counter() - started
@@ -0,0 +1,14 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.schema import build_schema
+
+
+class Command(BaseCommand):
+    help = 'Writes the OpenAPI schema and the swagger-ui/ReDoc pages under STATIC_ROOT'
+
+    def handle(self, *args, **options):
+        if not apps.is_installed('drf_yasg'):
+            raise CommandError('drf_yasg is not installed; run with SHOP_PREBUILT_SCHEMA=0')
+        for path in build_schema():
+            self.stdout.write(f'wrote {path}')
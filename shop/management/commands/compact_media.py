@@ -0,0 +1,68 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage, get_storage_class
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from shop.cache import bump_version
+from shop.models import Product
+from shop.storage import ContentAddressedStorage, acquire, get_referenced_names, is_blob
+
+
+class Command(BaseCommand):
+    help = ('Moves product images into content-addressed blobs, sharing identical files, '
+            'and deletes blobs no product references')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        if not issubclass(get_storage_class(), ContentAddressedStorage):
+            raise CommandError('DEFAULT_FILE_STORAGE is not shop.storage.ContentAddressedStorage')
+        before = self.disk_usage()
+        moved = self.rehome(options['dry_run'])
+        removed = self.sweep(options['dry_run'])
+        after = self.disk_usage()
+        self.stdout.write(f'moved {moved} images into blobs, removed {removed} unreferenced files, '
+                          f'{before / 2 ** 20:.1f} MiB -> {after / 2 ** 20:.1f} MiB')
+
+    def rehome(self, dry_run):
+        moved = 0
+        legacy = Product.objects.exclude(image='').values_list('image', flat=True).distinct()
+        for name in [name for name in legacy if not is_blob(name)]:
+            if not default_storage.exists(name):
+                self.stderr.write(f'missing {name}')
+                continue
+            moved += 1
+            if dry_run:
+                continue
+            with default_storage.open(name, 'rb') as file:
+                blob = default_storage.save(name, file)
+            # Variants follow their source name, so they are rendered again by backfill_image_variants
+            with transaction.atomic():
+                products = Product.objects.filter(image=name).update(image=blob, updated_at=timezone.now())
+                acquire(*[blob] * products)
+            default_storage.delete(name)
+        if moved and not dry_run:
+            bump_version(Product)
+        return moved
+
+    def sweep(self, dry_run):
+        referenced = get_referenced_names()
+        removed = 0
+        for directory, _, files in os.walk(settings.MEDIA_ROOT):
+            for filename in files:
+                name = os.path.relpath(os.path.join(directory, filename), settings.MEDIA_ROOT).replace(os.sep, '/')
+                if is_blob(name) and name not in referenced:
+                    removed += 1
+                    if not dry_run:
+                        default_storage.delete(name)
+        return removed
+
+    def disk_usage(self):
+        return sum(
+            os.path.getsize(os.path.join(directory, filename))
+            for directory, _, files in os.walk(settings.MEDIA_ROOT) for filename in files
+        )
@@ -0,0 +1,130 @@
+import datetime
+import json
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from shop.benchmark import rolled_back, seed_data
+from shop.models import *
+
+
+DEFAULT_PATHS = [
+    '/api/products',
+    '/api/products?order_by=price',
+    '/api/products?order_by=-price',
+    '/api/products?order_by=expired_date',
+    '/api/products?search=milk',
+    '/api/orders',
+]
+
+# Plan steps that read a whole table without an index, or sort outside one
+FULL_SCAN_MARKERS = {
+    'sqlite': re.compile(r'SCAN shop_\w+$', re.MULTILINE),
+    'postgresql': re.compile(r'Seq Scan on shop_'),
+}
+SORT_MARKERS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE'),
+    'postgresql': re.compile(r'Sort Key'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the SQL issued by shop endpoints and common product/order access patterns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many synthetic products first')
+        parser.add_argument('--orders', type=int, default=0, help='Insert this many synthetic orders of the seeded products first')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows instead of rolling back')
+        parser.add_argument('--analyze', action='store_true', help='Use EXPLAIN ANALYZE on PostgreSQL')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+
+    def handle(self, *args, **options):
+        with rolled_back(options['keep']):
+            if options['seed'] or options['orders']:
+                try:
+                    elapsed = seed_data(options['seed'], options['orders'])
+                except ValueError as error:
+                    raise CommandError(str(error))
+                self.stderr.write(f'seeded {options["seed"]} products and {options["orders"]} orders in {elapsed:.1f}s')
+            report = self.run(options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for entry in report:
+            flags = [flag for flag in ('full_scan', 'sort') if entry[flag]]
+            self.stdout.write(f'== {entry["name"]} ({entry["ms"]:.1f} ms) {" ".join(flags) or "indexed"}')
+            self.stdout.write(f'   {entry["sql"]}')
+            for line in entry['plan']:
+                self.stdout.write(f'     {line}')
+
+    def run(self, options):
+        customer_id = Order.objects.values_list('customer_id', flat=True).order_by('-id').first()
+        customer = Customer.objects.filter(id=customer_id).first() or Customer(email='explain@example.com')
+        client = APIClient()
+        client.force_authenticate(customer)
+
+        report = []
+        for path in options['paths']:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(path)
+            next_link = getattr(response, 'data', None) and isinstance(response.data, dict) and response.data.get('next')
+            if next_link:
+                with CaptureQueriesContext(connection) as next_queries:
+                    client.get(next_link)
+                queries.captured_queries.extend(next_queries.captured_queries)
+            for query in queries.captured_queries:
+                if query['sql'].lstrip().upper().startswith('SELECT'):
+                    report.append(self.explain(f'GET {path}', query['sql'], float(query['time']) * 1000, options))
+
+        for name, queryset in self.get_access_patterns(customer).items():
+            sql = str(queryset.query)
+            plan = queryset.explain(analyze=True) if options['analyze'] and connection.vendor == 'postgresql' else queryset.explain()
+            started = time.perf_counter()
+            list(queryset)
+            report.append(self.describe(name, sql, plan.splitlines(), (time.perf_counter() - started) * 1000))
+        return report
+
+    def get_access_patterns(self, customer):
+        product = Product.objects.order_by('-id').first()
+        if product is None:
+            return {}
+        today = datetime.date.today()
+        return {
+            'products by category, by price': Product.objects.filter(category_id=product.category_id).order_by('price', 'id')[:100],
+            'products by manufacturer, by price': Product.objects.filter(manufacturer_id=product.manufacturer_id).order_by('price', 'id')[:100],
+            'products by price, page after cursor': Product.objects.filter(
+                Q(price__gt=product.price) | Q(price=product.price, id__gt=product.id)
+            ).order_by('price', 'id')[:100],
+            'products expiring within 7 days': Product.objects.filter(
+                expired_date__gte=today, expired_date__lte=today + datetime.timedelta(days=7)
+            ).order_by('expired_date', 'id')[:100],
+            'orders by customer and status': Order.objects.filter(customer=customer, status='delivery').order_by('id')[:100],
+        }
+
+    def explain(self, name, sql, elapsed, options):
+        prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+        if options['analyze'] and connection.vendor == 'postgresql':
+            prefix = 'EXPLAIN ANALYZE'
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}')
+            rows = cursor.fetchall()
+        plan = [' '.join(str(column) for column in row[-1:]) for row in rows]
+        return self.describe(name, sql, plan, elapsed)
+
+    def describe(self, name, sql, plan, elapsed):
+        text = '\n'.join(plan)
+        return {
+            'name': name,
+            'sql': sql,
+            'plan': plan,
+            'ms': elapsed,
+            'full_scan': bool(FULL_SCAN_MARKERS[connection.vendor].search(text)) if connection.vendor in FULL_SCAN_MARKERS else None,
+            'sort': bool(SORT_MARKERS[connection.vendor].search(text)) if connection.vendor in SORT_MARKERS else None,
+        }
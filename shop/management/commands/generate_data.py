@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.analytics import rebuild_summaries
+from shop.generator import Generator
+
+
+class Command(BaseCommand):
+    help = ('Generates synthetic customers, manufacturers, products and orders on several processes; '
+            'the same seed gives the same data on the same day')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10_000)
+        parser.add_argument('--manufacturers', type=int, default=1_000)
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, help='Generating processes, one per CPU by default')
+        parser.add_argument('--password', default='password', help='Password of every generated customer')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        generator = Generator(options['seed'], options['workers'], options['password'], log=self.log)
+        try:
+            generator.run(options['customers'], options['manufacturers'], options['products'], options['orders'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        if options['orders']:
+            rebuilt = time.perf_counter()
+            rebuild_summaries()
+            self.stdout.write(f'sales summaries rebuilt in {time.perf_counter() - rebuilt:.1f}s')
+        self.stdout.write(f'done in {time.perf_counter() - started:.1f}s')
+
+    def log(self, message):
+        self.stdout.write(message)
@@ -0,0 +1,30 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.importers import READERS, ProductImporter
+
+
+class Command(BaseCommand):
+    help = 'Upserts products from a CSV or NDJSON file (use - for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=ProductImporter.batch_size)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError('Pass --format csv or --format ndjson')
+
+        importer = ProductImporter(batch_size=options['batch_size'])
+        if path == '-':
+            report = importer.run(READERS[file_format](sys.stdin.buffer))
+        else:
+            with open(path, 'rb') as stream:
+                report = importer.run(READERS[file_format](stream))
+        self.stdout.write(json.dumps(report, indent=2, default=str))
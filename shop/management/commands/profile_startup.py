@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.startup import rank_packages, run_probe
+
+
+DEFAULT_PATHS = ['/', '/api/category', '/api/products', '/api/orders']
+
+
+class Command(BaseCommand):
+    help = 'Cold-starts api.wsgi in a fresh interpreter and ranks import time per phase and first-request latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Packages and modules listed per phase')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+
+    def handle(self, *args, **options):
+        try:
+            timings, phases = run_probe(options['paths'], importtime=True)
+        except RuntimeError as error:
+            raise CommandError(str(error))
+
+        report = []
+        for phase in ['load', *options['paths']]:
+            records = phases.get(phase, [])
+            timing = timings[phase]
+            report.append({
+                'phase': phase,
+                'status': timing.get('status') if isinstance(timing, dict) else None,
+                'ms': (timing['seconds'] if isinstance(timing, dict) else timing) * 1000,
+                'import_ms': sum(record[0] for record in records) / 1000,
+                'modules': len(records),
+                'packages': [(name, us / 1000) for name, us in rank_packages(records)[:options['top']]],
+                'slowest': [
+                    (name, cumulative / 1000)
+                    for _, cumulative, _, name in sorted(records, key=lambda record: record[1], reverse=True)
+                    if not name.startswith('encodings')
+                ][:options['top']],
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for entry in report:
+            status = f' -> {entry["status"]}' if entry['status'] else ''
+            self.stdout.write(f'== {entry["phase"]}{status}: {entry["ms"]:.1f} ms, '
+                              f'{entry["import_ms"]:.1f} ms importing {entry["modules"]} modules')
+            for name, ms in entry['packages']:
+                self.stdout.write(f'   {ms:8.1f} ms  {name}')
+            if entry['slowest']:
+                self.stdout.write('   slowest imports (cumulative):')
+            for name, ms in entry['slowest']:
+                self.stdout.write(f'   {ms:8.1f} ms  {name}')
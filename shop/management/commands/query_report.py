@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from shop.models import *
+
+
+class Command(BaseCommand):
+    help = 'Prints the number of SQL queries every shop GET endpoint runs against the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Customer to authenticate as (defaults to the first staff user)')
+        parser.add_argument('--show-sql', action='store_true', help='Print every captured query')
+
+    def handle(self, *args, **options):
+        if options['email']:
+            user = Customer.objects.get(email=options['email'])
+        else:
+            user = Customer.objects.filter(is_staff=True).first() or Customer.objects.first()
+
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+
+        self.stdout.write(f'{"endpoint":<32} {"status":>6} {"rows":>7} {"queries":>8}')
+        for path in self.get_paths(user):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(path)
+            data = getattr(response, 'data', None)
+            if isinstance(data, dict) and 'results' in data:
+                data = data['results']
+            rows = len(data) if isinstance(data, list) else 1
+            self.stdout.write(f'{path:<32} {response.status_code:>6} {rows:>7} {len(queries):>8}')
+            if options['show_sql']:
+                for query in queries.captured_queries:
+                    self.stdout.write(f'    {query["sql"]}')
+
+    def get_paths(self, user):
+        paths = ['/api/category', '/api/products', '/api/manufacturer', '/api/сountry']
+        if user is not None:
+            paths += ['/api/orders', '/api/profile']
+        for prefix, model in [
+            ('category', Category),
+            ('products', Product),
+            ('manufacturer', Manufacturer),
+            ('сountry', Country),
+            ('orders', Order),
+        ]:
+            pk = model.objects.values_list('id', flat=True).first()
+            if pk is not None:
+                paths.append(f'/api/{prefix}/{pk}')
+        return paths
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.analytics import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the sales summary tables from all orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50000, help='Orders aggregated per query')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild_summaries(batch_size=options['batch_size'])
+        self.stdout.write(f'wrote {rows} summary rows in {time.perf_counter() - started:.1f}s')
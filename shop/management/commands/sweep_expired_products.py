@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.cache import bump_version
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Flags products that expired since the last run; schedule it daily, shortly after midnight'
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        expired = Product.objects.filter(is_expired=False, expired_date__lt=today).update(is_expired=True)
+        # Products moved to a later date with update() or a raw import
+        restored = Product.objects.filter(is_expired=True, expired_date__gte=today).update(is_expired=False)
+        # The day moved on, and with it every expiry window cached under the Product version
+        bump_version(Product)
+        self.stdout.write(f'flagged {expired} expired products, cleared {restored}')
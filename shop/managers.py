@@ -1,4 +1,9 @@
+import datetime
+
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models
+from django.db.models import Count, Q
+from django.utils import timezone
 
 
 class CustomerManager(BaseUserManager):
@@ -15,3 +20,36 @@ class CustomerManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', True)
         extra_fields.setdefault('is_staff', True)
         return self.create_user(email, password, **extra_fields)
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Expiry queries. Each one is a range on ``expired_date``, which the
+    ``product_expired_date_idx`` index serves.
+    """
+    def expired(self, today=None):
+        return self.filter(expired_date__lt=today or timezone.localdate())
+
+    def unexpired(self, today=None):
+        # The flag narrows the scan to the (is_expired, id) index; the date keeps
+        # the result exact for products that expired since the last sweep
+        return self.filter(is_expired=False, expired_date__gte=today or timezone.localdate())
+
+    def expiring(self, days, today=None):
+        today = today or timezone.localdate()
+        return self.filter(expired_date__gte=today, expired_date__lte=today + datetime.timedelta(days=days))
+
+    def expiry_by_category(self, days, today=None):
+        """
+        Count the products that expired in the last ``days`` days and those
+        expiring within the next ``days`` days per category. Both sides are
+        bounded, so only that window of ``product_expired_date_idx`` is read.
+        """
+        today = today or timezone.localdate()
+        window = datetime.timedelta(days=days)
+        return self.filter(expired_date__gte=today - window, expired_date__lte=today + window).values(
+            'category_id', 'category__name'
+        ).annotate(
+            expired=Count('id', filter=Q(expired_date__lt=today)),
+            expiring=Count('id', filter=Q(expired_date__gte=today)),
+        ).order_by('category_id')
@@ -0,0 +1,245 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+# Upper bounds of the histogram buckets, in seconds and in queries
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+HISTOGRAMS = {
+    'request': ('shop_request_duration_seconds', 'Time spent handling the request', DURATION_BUCKETS),
+    'view': ('shop_view_duration_seconds', 'Time spent in the view', DURATION_BUCKETS),
+    'db': ('shop_db_duration_seconds', 'Time spent running SQL', DURATION_BUCKETS),
+    'serializer': ('shop_serializer_duration_seconds', 'Time spent in serializers', DURATION_BUCKETS),
+    'queries': ('shop_db_queries', 'SQL queries run', QUERY_BUCKETS),
+}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+current = contextvars.ContextVar('shop_request_timings', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    """
+    Per-process histograms keyed on ``(metric, route, method)``.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, route, method, timings):
+        with self.lock:
+            for metric, (_, _, buckets) in HISTOGRAMS.items():
+                key = (metric, route, method)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(buckets)
+                self.histograms[key].observe(timings[metric])
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def export(self):
+        """
+        Render every histogram in the Prometheus text exposition format.
+        """
+        with self.lock:
+            series = defaultdict(list)
+            for (metric, route, method), histogram in sorted(self.histograms.items()):
+                series[metric].append((route, method, list(histogram.counts), histogram.count, histogram.sum))
+
+        lines = []
+        for metric, (name, description, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for route, method, counts, count, total in series[metric]:
+                labels = f'route="{escape(route)}",method="{method}"'
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {total}')
+                lines.append(f'{name}_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Timings:
+    def __init__(self):
+        self.queries = 0
+        self.db = 0
+        self.serializer = 0
+        self.view = 0
+        self.view_started = None
+        self.in_serializer = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper: every query of the request passes through here
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+@contextmanager
+def measure_serialization():
+    """
+    Count the time inside the block as serializer time of the current request.
+    Serialization that DRF serializers don't do (``values()`` rows, export
+    streams) is wrapped in it explicitly.
+    """
+    timings = current.get()
+    # Nested and repeated calls are already inside an outer measurement
+    if timings is None or timings.in_serializer:
+        yield
+        return
+    timings.in_serializer = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serializer += time.perf_counter() - started
+        timings.in_serializer = False
+
+
+def timed_serializer(method):
+    def wrapper(serializer, *args, **kwargs):
+        with measure_serialization():
+            return method(serializer, *args, **kwargs)
+    wrapper.timed = True
+    return wrapper
+
+
+def timed_iterator(iterable):
+    # Produce every item inside measure_serialization, for lazily encoded bodies
+    iterator = iter(iterable)
+    while True:
+        with measure_serialization():
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def install_serializer_timing():
+    """
+    Time ``is_valid()`` and ``.data`` of every DRF serializer. Views reach
+    serialization only through those two, and nested serializers run inside them.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    if getattr(BaseSerializer.is_valid, 'timed', False):
+        return
+    BaseSerializer.is_valid = timed_serializer(BaseSerializer.is_valid)
+    BaseSerializer.data = property(timed_serializer(BaseSerializer.data.fget))
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    return '/' + match.route if match is not None and match.route else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Measure every request: SQL query count and time, serializer time, view
+    time (rendering included) and the total. The numbers are sent back in a ``Server-Timing``
+    header and added to per-route histograms, exported by ``/api/metrics``.
+
+    A streamed body is produced after the headers are sent, so its
+    ``Server-Timing`` only covers the time to the first byte; the histograms
+    are updated once the stream is exhausted and include all of it.
+
+    Opt in with ``SHOP_METRICS = True``; it should be first in MIDDLEWARE.
+    Database time spent while serializing counts towards both.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_serializer_timing()
+
+    def __call__(self, request):
+        timings = Timings()
+        started = time.perf_counter()
+        with self.measure(timings):
+            response = self.get_response(request)
+        response['Server-Timing'] = self.get_header(timings, started)
+        if response.streaming:
+            response.streaming_content = self.stream(response.streaming_content, request, timings, started)
+        else:
+            self.observe(request, timings, started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current.get().view_started = time.perf_counter()
+
+    @contextmanager
+    def measure(self, timings):
+        token = current.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                yield
+        finally:
+            current.reset(token)
+
+    def stream(self, content, request, timings, started):
+        iterator = iter(content)
+        try:
+            while True:
+                with self.measure(timings):
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                yield chunk
+        finally:
+            self.observe(request, timings, started)
+
+    def get_header(self, timings, started):
+        finished = time.perf_counter()
+        if timings.view_started is not None:
+            timings.view = finished - timings.view_started
+        return ', '.join([
+            f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries"',
+            f'serializer;dur={timings.serializer * 1000:.1f}',
+            f'view;dur={timings.view * 1000:.1f}',
+            f'total;dur={(finished - started) * 1000:.1f}',
+        ])
+
+    def observe(self, request, timings, started):
+        finished = time.perf_counter()
+        if timings.view_started is not None:
+            timings.view = finished - timings.view_started
+        registry.observe(get_route(request), request.method, {
+            'request': finished - started, 'view': timings.view, 'db': timings.db,
+            'serializer': timings.serializer, 'queries': timings.queries,
+        })
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
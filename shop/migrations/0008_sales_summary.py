@@ -0,0 +1,59 @@
+# Generated by Django 4.1.3 on 2026-10-18 13:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_updated_at(apps, schema_editor):
+    # The closest thing to an order date existing rows have
+    Order = apps.get_model('shop', 'Order')
+    Order.objects.update(created_at=models.F('updated_at'))
+
+
+def rebuild_summary(apps, schema_editor):
+    from shop.analytics import rebuild_summaries
+
+    rebuild_summaries(apps.get_model('shop', 'Order'), apps.get_model('shop', 'SalesSummary'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_image_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('product', 'product'), ('category', 'category'), ('manufacturer', 'manufacturer')], max_length=20)),
+                ('key', models.BigIntegerField()),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('delivered_orders', models.IntegerField(default=0)),
+                ('delivered_revenue', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Sales summary',
+                'verbose_name_plural': 'Sales summaries',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='salessummary',
+            index=models.Index(fields=['dimension', 'day'], name='sales_summary_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='salessummary',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key', 'day'), name='sales_summary_unique'),
+        ),
+        migrations.RunPython(rebuild_summary, migrations.RunPython.noop),
+    ]
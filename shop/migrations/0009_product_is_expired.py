@@ -0,0 +1,29 @@
+# Generated by Django 4.1.3 on 2026-10-18 13:52
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def flag_expired(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Product.objects.filter(expired_date__lt=timezone.localdate()).update(is_expired=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_sales_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='is_expired',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(flag_expired, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_expired', 'id'], name='product_unexpired_idx'),
+        ),
+    ]
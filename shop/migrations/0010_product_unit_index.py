@@ -0,0 +1,17 @@
+# Generated by Django 4.1.3 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_is_expired'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['unit', 'price', 'id'], name='product_unit_price_idx'),
+        ),
+    ]
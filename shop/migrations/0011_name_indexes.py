@@ -0,0 +1,21 @@
+# Generated by Django 4.1.3 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_product_unit_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='manufacturer',
+            index=models.Index(fields=['name', 'id'], name='manufacturer_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ),
+    ]
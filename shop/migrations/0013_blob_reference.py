@@ -0,0 +1,36 @@
+# Generated by Django 4.1.3 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+from shop.storage import get_reference_counts
+
+
+def count_references(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    BlobReference = apps.get_model('shop', 'BlobReference')
+    counts = get_reference_counts(Product.objects.values_list('image', 'image_variants').iterator())
+    BlobReference.objects.bulk_create(
+        [BlobReference(name=name, references=count) for name, count in counts.items()], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_customer_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlobReference',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('references', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Blob reference',
+                'verbose_name_plural': 'Blob references',
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.3 on 2026-10-18 15:07
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_blob_reference'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='customer',
+            name='token_version',
+        ),
+    ]
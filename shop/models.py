@@ -1,6 +1,7 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
-from .managers import CustomerManager
+from .managers import CustomerManager, ProductQuerySet
 
 
 UNIT_CHOICES = [
@@ -43,6 +44,7 @@ class Customer(AbstractBaseUser, PermissionsMixin):
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -68,6 +70,7 @@ class Manufacturer(models.Model):
     country = models.ForeignKey('Country', on_delete=models.SET_NULL, null=True)
     address = models.TextField()
     email = models.EmailField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -75,26 +78,56 @@ class Manufacturer(models.Model):
     class Meta:
         verbose_name = 'Manufacturer'
         verbose_name_plural = 'Manufacturers'
+        indexes = [
+            models.Index(fields=['name', 'id'], name='manufacturer_name_idx'),
+        ]
 
 
 class Product(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(null=True, blank=True)
-    image = models.ImageField(upload_to='products')
-    manufacturer = models.ForeignKey('Manufacturer', on_delete=models.CASCADE)
-    category = models.ForeignKey('Category', on_delete=models.SET_NULL, null=True)
+    image = models.ImageField(upload_to='products', db_index=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    manufacturer = models.ForeignKey('Manufacturer', on_delete=models.CASCADE, db_index=False)
+    category = models.ForeignKey('Category', on_delete=models.SET_NULL, null=True, db_index=False)
     price = models.PositiveIntegerField()
     value = models.DecimalField(max_digits=10, decimal_places=2)
     unit = models.CharField(max_length=20, choices=UNIT_CHOICES)
     manufacturing_date = models.DateField()
     expired_date = models.DateField()
+    # Kept current by save(), the importer and the sweep_expired_products command
+    is_expired = models.BooleanField(default=False, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def set_expired(self, today=None):
+        expired_date = self._meta.get_field('expired_date').to_python(self.expired_date)
+        self.is_expired = expired_date is not None and expired_date < (today or timezone.localdate())
+
+    def save(self, *args, **kwargs):
+        self.set_expired()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'expired_date' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'is_expired'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
+        # The foreign keys are covered by the leading column of the composite indexes
+        indexes = [
+            models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['manufacturer', 'price', 'id'], name='product_manufacturer_price_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+            models.Index(fields=['unit', 'price', 'id'], name='product_unit_price_idx'),
+            models.Index(fields=['expired_date', 'id'], name='product_expired_date_idx'),
+            models.Index(fields=['is_expired', 'id'], name='product_unexpired_idx'),
+        ]
 
 
 class Order(models.Model):
@@ -104,19 +137,76 @@ class Order(models.Model):
 
     )
     product = models.ForeignKey('Product', on_delete=models.CASCADE)
-    customer = models.ForeignKey('Customer',null=True,blank=True, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    customer = models.ForeignKey('Customer',null=True,blank=True, on_delete=models.CASCADE, db_index=False)
     delivery_address = models.CharField(max_length=100)
     phone_customer = models.CharField(max_length=20,null=True,blank=True)
     final_price = models.IntegerField(default=0)
     status = models.CharField(max_length=20,default='not delivery',choices=STATUS_CHOISES)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
         if self.customer:
             self.phone_customer = self.customer.phone
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'id'], name='order_customer_idx'),
+            models.Index(fields=['customer', 'status', 'id'], name='order_customer_status_idx'),
+        ]
+
+
+class SalesSummary(models.Model):
+    """
+    Order totals per day for one product, category or manufacturer.
+
+    Rows are kept up to date by the Order signals and ``checkout_cart`` (see
+    shop/analytics.py) and can be recomputed with ``rebuild_sales_summary``.
+    ``key`` is the id of the product, category or manufacturer; orders of
+    uncategorized products count under category 0. ``revenue`` is the
+    product price times the quantity, before any wallet payment.
+
+    Category and manufacturer rows follow a product moved by ``save()`` or
+    the importer. Price changes, and products re-keyed by other bulk updates
+    (a deleted category nulls theirs), only show up after a rebuild.
+    """
+    DIMENSIONS = (
+        ('product', 'product'),
+        ('category', 'category'),
+        ('manufacturer', 'manufacturer'),
+    )
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS)
+    key = models.BigIntegerField()
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    delivered_orders = models.IntegerField(default=0)
+    delivered_revenue = models.BigIntegerField(default=0)
 
+    class Meta:
+        verbose_name = 'Sales summary'
+        verbose_name_plural = 'Sales summaries'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key', 'day'], name='sales_summary_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', 'day'], name='sales_summary_day_idx'),
+        ]
+
+
+class BlobReference(models.Model):
+    """
+    How many product images and current image variants point at a
+    content-addressed blob. Kept by ``acquire`` and ``release`` in
+    shop/storage.py, in the transaction of the product write; a blob is
+    deleted once its count drops to zero.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    references = models.IntegerField(default=0)
 
-
-
-
+    class Meta:
+        verbose_name = 'Blob reference'
+        verbose_name_plural = 'Blob references'
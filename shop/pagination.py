@@ -0,0 +1,199 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Model, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, which would make the
+    # cursor compare unequal to the row it came from
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination over the ordering already applied to the queryset.
+
+    The primary key is appended as a tiebreaker and the cursor stores the sort
+    values of the row at the page boundary, so every page is fetched with an
+    indexed ``WHERE (key) > (cursor) ... LIMIT n`` instead of an OFFSET scan.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.nullable = [self.is_nullable(queryset.model, field) for field, _ in self.ordering]
+        self.fields = [self.get_field(queryset.model, field) for field, _ in self.ordering]
+
+        position, reverse = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.get_order_expressions(reverse))
+        if position is not None:
+            queryset = queryset.filter(self.get_after_filter(position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            if has_more or reverse:
+                self.next_position = self.get_position(results[-1])
+            if (has_more and reverse) or (position is not None and not reverse):
+                self.previous_position = self.get_position(results[0])
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.next_position, reverse=False)),
+            ('previous', self.get_link(self.previous_position, reverse=True)),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        pk_name = queryset.model._meta.pk.name
+        ordering = []
+        for item in queryset.query.order_by:
+            if not isinstance(item, str) or item == '?':
+                raise NotFound('Unsupported ordering for cursor pagination')
+            desc = item.startswith('-')
+            field = item.lstrip('-')
+            ordering.append((pk_name if field == 'pk' else field, desc))
+        if pk_name not in [field for field, _ in ordering]:
+            # Break ties in the direction of the last key so one index serves the whole ordering
+            ordering.append((pk_name, ordering[-1][1] if ordering else False))
+        return ordering
+
+    def is_nullable(self, model, path):
+        for name in path.split('__'):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return False
+            if field.null:
+                return True
+            model = field.related_model
+            if model is None:
+                return False
+        return False
+
+    def get_field(self, model, path):
+        field = None
+        for name in path.split('__'):
+            if model is None:
+                return None
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations such as search_rank
+                return None
+            model = field.related_model
+        return field
+
+    def get_order_expressions(self, reverse):
+        # Nullable keys get explicit NULL placement so the cursor filter is
+        # the same on SQLite and PostgreSQL.
+        expressions = []
+        for (field, desc), nullable in zip(self.ordering, self.nullable):
+            if desc != reverse:
+                expressions.append(F(field).desc(nulls_last=True) if nullable else F(field).desc())
+            else:
+                expressions.append(F(field).asc(nulls_first=True) if nullable else F(field).asc())
+        return expressions
+
+    def get_after_filter(self, position, reverse):
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (field, desc), value in zip(self.ordering, position):
+            if desc != reverse:
+                after = None if value is None else Q(**{f'{field}__lt': value}) | Q(**{f'{field}__isnull': True})
+            else:
+                after = Q(**{f'{field}__isnull': False}) if value is None else Q(**{f'{field}__gt': value})
+            if after is not None:
+                condition |= equal & after
+            equal &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+        return condition
+
+    def get_position(self, instance):
+        if isinstance(instance, dict):
+            # values() rows carry the ordering columns under their lookups
+            return [instance[field] for field, _ in self.ordering]
+        position = []
+        for field, _ in self.ordering:
+            value = instance
+            *path, last = field.split('__')
+            for name in path:
+                value = getattr(value, name, None)
+            if value is not None:
+                # Read the raw column of a trailing foreign key instead of loading the row
+                value = getattr(value, f'{last}_id', getattr(value, last, None))
+            if isinstance(value, Model):
+                value = value.pk
+            position.append(value)
+        return position
+
+    def encode_cursor(self, position, reverse):
+        payload = {'o': [f'{"-" if desc else ""}{field}' for field, desc in self.ordering], 'p': position}
+        if reverse:
+            payload['r'] = 1
+        data = json.dumps(payload, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            ordering = [f'{"-" if desc else ""}{field}' for field, desc in self.ordering]
+            if payload['o'] != ordering or len(payload['p']) != len(ordering):
+                raise ValueError
+            # Parse the values back into the column types, datetimes with their microseconds
+            position = [
+                field.to_python(value) if field is not None and value is not None else value
+                for field, value in zip(self.fields, payload['p'])
+            ]
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_link(self, position, reverse):
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
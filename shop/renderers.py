@@ -0,0 +1,85 @@
+from django.db.models.fields.files import FieldFile
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.mediatypes import media_type_matches
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+encoder = JSONEncoder()
+
+
+def to_primitive(value):
+    """
+    Fallback for the values the encoders do not know: file fields become their
+    URL, and the rest (decimals, datetimes, lazy strings, UUIDs) is encoded as
+    DRF's JSON encoder does it, so every renderer gives the same values.
+    """
+    if isinstance(value, FieldFile):
+        return value.url if value else None
+    return encoder.default(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON through orjson, asked for with ``Accept: application/json; encoder=fast``.
+    ``ContentNegotiation`` only picks it for that exact media type; a plain
+    ``application/json`` or ``*/*`` keeps getting DRF's ``JSONRenderer``.
+
+    Datetimes go through DRF's encoder to keep its format (``Z`` for UTC).
+    Falls back to ``JSONRenderer`` when orjson is not installed.
+    """
+    media_type = 'application/json; encoder=fast'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=to_primitive, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack, for ``Accept: application/msgpack`` or ``?format=msgpack``.
+    Needs the msgpack package; only registered when it is installed.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=to_primitive, use_bin_type=True)
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    """
+    DRF's negotiation, except that a renderer whose media type has parameters
+    (``application/json; encoder=fast``) is only picked when the Accept header
+    names all of them, and is then preferred over a plain renderer of the
+    same type. Every other request, and the fallback for an unacceptable
+    one, gets the first plain renderer.
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        accepted = [media_type.strip() for media_type in request.META.get('HTTP_ACCEPT', '').split(',')]
+        plain = []
+        for renderer in renderers:
+            if ';' not in renderer.media_type:
+                plain.append(renderer)
+                continue
+            for media_type in accepted:
+                if not media_type.startswith('*') and media_type_matches(renderer.media_type, media_type):
+                    return renderer, renderer.media_type
+        return super().select_renderer(request, plain or renderers, format_suffix)
@@ -0,0 +1,143 @@
+import functools
+import json
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.urls import reverse
+
+
+SCHEMA_DIR = 'openapi'
+SCHEMA_FORMATS = {
+    'json': 'application/json',
+    'yaml': 'application/yaml',
+}
+API_VERSION = 'v1.0'
+UI_TEMPLATES = {
+    'swagger': 'drf-yasg/swagger-ui.html',
+    'redoc': 'drf-yasg/redoc.html',
+}
+
+
+class Unused:
+    """
+    Stand-in for the ``drf_yasg.openapi`` module when drf_yasg is not
+    installed: every attribute and call returns the stand-in again, so the
+    ``swagger_auto_schema`` annotations on the views cost nothing at import.
+    """
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+
+if apps.is_installed('drf_yasg'):
+    from drf_yasg import openapi
+    from drf_yasg.utils import swagger_auto_schema
+else:
+    openapi = Unused()
+
+    def swagger_auto_schema(**kwargs):
+        return lambda view_method: view_method
+
+
+def get_info():
+    return openapi.Info(
+        title='Store',
+        default_version=API_VERSION,
+        description='This is an electronic grocery store',
+        terms_of_service='',
+        contact=openapi.Contact(name='Suyog Mahajan', url='', email='SuyogMahajan2111@gmail.com'),
+        license=openapi.License(name='JustCode', url=''),
+    )
+
+
+def generate_schema(schema_format):
+    """
+    Walk every API view and encode the OpenAPI schema as ``json`` or ``yaml``.
+    """
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(get_info()).get_schema(request=None, public=True)
+    codec = OpenAPICodecYaml if schema_format == 'yaml' else OpenAPICodecJson
+    return codec(validators=[]).encode(schema)
+
+
+def render_ui(ui, spec_url, request=None):
+    """
+    Render the swagger-ui or ReDoc page reading its schema from ``spec_url``.
+    Without a ``request`` the page is rendered for a static file, with no session login.
+    """
+    from django.test import RequestFactory
+    from drf_yasg.renderers import ReDocRenderer, SwaggerUIRenderer
+
+    renderer = SwaggerUIRenderer() if ui == 'swagger' else ReDocRenderer()
+    context = {'request': request or RequestFactory().get('/')}
+    renderer.set_context(context)
+    key = 'swagger_settings' if ui == 'swagger' else 'redoc_settings'
+    context[key] = json.dumps({**json.loads(context[key]), 'url': spec_url})
+    info = get_info()
+    context.update(title=info.title, version=API_VERSION)
+    if request is None:
+        context['USE_SESSION_AUTH'] = False
+    return render_to_string(UI_TEMPLATES[ui], context, context['request'])
+
+
+def get_schema_path(name):
+    return os.path.join(settings.STATIC_ROOT, SCHEMA_DIR, name)
+
+
+def get_schema_url(name):
+    return static(f'{SCHEMA_DIR}/{name}')
+
+
+def build_schema():
+    """
+    Write the schema in every format and both docs pages under STATIC_ROOT.
+
+    The pages load the static schema file, so a deployment serves all of them
+    as static files without running any view.
+    """
+    os.makedirs(get_schema_path(''), exist_ok=True)
+    written = []
+    for schema_format in SCHEMA_FORMATS:
+        written.append(write_file(f'swagger.{schema_format}', generate_schema(schema_format)))
+    for ui in UI_TEMPLATES:
+        page = render_ui(ui, get_schema_url('swagger.json'))
+        written.append(write_file(f'{ui}.html', page.encode()))
+    return written
+
+
+def write_file(name, content):
+    path = get_schema_path(name)
+    with open(path, 'wb') as file:
+        file.write(content)
+    return path
+
+
+@functools.lru_cache(maxsize=None)
+def get_live_schema(schema_format):
+    return generate_schema(schema_format)
+
+
+def schema_view(request, format):
+    """
+    Serve the OpenAPI schema: a redirect to the prebuilt static file when
+    drf_yasg is left out of the deployment, otherwise generated once per process.
+    """
+    if format not in SCHEMA_FORMATS:
+        raise Http404
+    if not apps.is_installed('drf_yasg'):
+        return HttpResponseRedirect(get_schema_url(f'swagger.{format}'))
+    return HttpResponse(get_live_schema(format), content_type=SCHEMA_FORMATS[format])
+
+
+def schema_ui_view(request, ui):
+    if not apps.is_installed('drf_yasg'):
+        return HttpResponseRedirect(get_schema_url(f'{ui}.html'))
+    return HttpResponse(render_ui(ui, reverse('schema-json', kwargs={'format': 'json'}), request))
@@ -0,0 +1,146 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+
+TOKEN_RE = re.compile(r'\w+')
+
+FTS_TABLE = 'shop_product_fts'
+SEARCH_VECTOR = 'search_vector'
+SEARCH_CONFIG = 'english'
+SNIPPET_START = '<mark>'
+SNIPPET_STOP = '</mark>'
+# The database wraps matches in these private-use characters; format_snippet
+# escapes the text around them and only then turns them into the tags
+SNIPPET_START_MARKER = '\ue000'
+SNIPPET_STOP_MARKER = '\ue001'
+
+# SQLite: an external-content FTS5 table over shop_product, kept in sync by triggers.
+SQLITE_CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, content='shop_product', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+SQLITE_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON shop_product BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON shop_product BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON shop_product BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+]
+SQLITE_REBUILD = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+SQLITE_DROP = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+# PostgreSQL: a stored generated tsvector column, so it can never drift from the row.
+POSTGRES_CREATE = [
+    f"ALTER TABLE shop_product ADD COLUMN IF NOT EXISTS {SEARCH_VECTOR} tsvector GENERATED ALWAYS AS ("
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')) STORED",
+    f'CREATE INDEX IF NOT EXISTS shop_product_search_gin ON shop_product USING GIN ({SEARCH_VECTOR})',
+]
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS shop_product_search_gin',
+    f'ALTER TABLE shop_product DROP COLUMN IF EXISTS {SEARCH_VECTOR}',
+]
+
+
+def install_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in [SQLITE_CREATE_TABLE, *SQLITE_TRIGGERS, SQLITE_REBUILD]:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_CREATE:
+            schema_editor.execute(sql)
+
+
+def remove_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_DROP:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_DROP:
+            schema_editor.execute(sql)
+
+
+def ensure_search_triggers(sender, using='default', **kwargs):
+    # SQLite migrations rebuild a table by copying it, which drops its triggers
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if FTS_TABLE not in connection.introspection.table_names(cursor):
+            return
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
+
+
+def format_snippet(snippet):
+    """
+    HTML-escape a ``search_snippet`` and mark its matches with ``<mark>``.
+    """
+    if snippet is None:
+        return None
+    return escape(snippet).replace(SNIPPET_START_MARKER, SNIPPET_START).replace(SNIPPET_STOP_MARKER, SNIPPET_STOP)
+
+
+def like_search(queryset, term):
+    return queryset.filter(Q(name__contains=term) | Q(description__contains=term))
+
+
+def search_products(queryset, term):
+    """
+    Filter a Product queryset by ``term`` through the database full-text index.
+
+    Matching rows are annotated with ``search_rank`` (higher is better) and a
+    ``search_snippet`` to render with ``format_snippet``, and ordered by rank unless the queryset is
+    already ordered. Backends without an index fall back to LIKE matching.
+    """
+    tokens = TOKEN_RE.findall(term)
+    vendor = connections[queryset.db].vendor
+    if not tokens or vendor not in ('sqlite', 'postgresql'):
+        return like_search(queryset, term)
+
+    if vendor == 'sqlite':
+        # Quote every token so user input can't inject FTS5 syntax, prefix-match the last one
+        match = ' '.join(f'"{token}"' for token in tokens) + '*'
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = shop_product.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(
+            search_rank=RawSQL(f'-bm25({FTS_TABLE}, 10.0, 1.0)', []),
+            search_snippet=RawSQL(
+                f"snippet({FTS_TABLE}, -1, '{SNIPPET_START_MARKER}', '{SNIPPET_STOP_MARKER}', '…', 16)", []
+            ),
+        )
+    else:
+        query = ' & '.join(tokens[:-1] + [f'{tokens[-1]}:*'])
+        tsquery = 'to_tsquery(%s::regconfig, %s)'
+        queryset = queryset.extra(
+            where=[f'shop_product.{SEARCH_VECTOR} @@ {tsquery}'],
+            params=[SEARCH_CONFIG, query],
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank_cd(shop_product.{SEARCH_VECTOR}, {tsquery})', [SEARCH_CONFIG, query]),
+            search_snippet=RawSQL(
+                f"ts_headline(%s::regconfig, coalesce(shop_product.name, '') || ' ' || "
+                f"coalesce(shop_product.description, ''), {tsquery}, %s)",
+                [SEARCH_CONFIG, SEARCH_CONFIG, query,
+                 f'StartSel={SNIPPET_START_MARKER}, StopSel={SNIPPET_STOP_MARKER}, MaxWords=16, MinWords=6'],
+            ),
+        )
+
+    if not queryset.query.order_by:
+        queryset = queryset.order_by('-search_rank')
+    return queryset
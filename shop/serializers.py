@@ -1,17 +1,27 @@
+from decimal import Decimal
+
+from django.core.files.storage import default_storage
 from rest_framework.serializers import ModelSerializer, Serializer
 from .models import *
 from rest_framework import serializers
+from .images import get_variant_urls
+from .metrics import measure_serialization
+from .search import format_snippet
+from .storage import is_blob
+
+
+CENTS = Decimal('0.01')
 
 
 class CategorySerializer(ModelSerializer):
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ['updated_at']
 
 class ManufacturerSerializer(ModelSerializer):
     class Meta:
         model = Manufacturer
-        fields = '__all__'
+        exclude = ['updated_at']
 
     def to_representation(self, instance) -> dict:
         representation = super().to_representation(instance)
@@ -26,23 +36,206 @@ class CountrySerializer(ModelSerializer):
         fields = '__all__'
 
 
+# Every key a product can be rendered with, in output order; rank and snippet only come with a search
+PRODUCT_FIELDS = [
+    'id', 'name', 'description', 'manufacturer', 'category', 'price', 'value', 'unit',
+    'manufacturing_date', 'expired_date', 'image', 'image_variants', 'image_srcset', 'rank', 'snippet',
+]
+
+
 class ProductsSerializer(ModelSerializer):
+    """
+    Pass ``fields`` to render only those keys of ``PRODUCT_FIELDS``.
+    """
     class Meta:
         model = Product
         fields = ['id','name','description','manufacturer','category','price','value','unit','manufacturing_date','expired_date', 'image']
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested = None if fields is None else set(fields)
+        if self.requested is not None:
+            for name in set(self.fields) - self.requested:
+                self.fields.pop(name)
+
     def to_representation(self, instance) -> dict:
         representation = super().to_representation(instance)
-        representation['manufacturer'] = instance.manufacturer.name
-        representation['category'] = instance.category.name
+        if 'manufacturer' in representation:
+            representation['manufacturer'] = instance.manufacturer.name
+        if 'category' in representation:
+            representation['category'] = instance.category.name if instance.category else None
+        if self.is_requested('image_variants') or self.is_requested('image_srcset'):
+            variants, srcset = get_variant_urls(instance)
+            if self.is_requested('image_variants'):
+                representation['image_variants'] = variants
+            if self.is_requested('image_srcset'):
+                representation['image_srcset'] = srcset
+        if hasattr(instance, 'search_snippet'):
+            if self.is_requested('rank'):
+                representation['rank'] = instance.search_rank
+            if self.is_requested('snippet'):
+                representation['snippet'] = format_snippet(instance.search_snippet)
+        return representation
+
+    def is_requested(self, name):
+        return self.requested is None or name in self.requested
+
+
+def format_date(value):
+    return value.isoformat() if value is not None else None
+
+
+def format_image(name):
+    return default_storage.url(name) if name else None
+
+
+class ProductValuesSerializer:
+    """
+    Read-only counterpart of ``ProductsSerializer`` for the rows of a
+    ``values()`` query: the same keys and formats, without model instances or
+    DRF field objects. Covers every field that is a column of the product or
+    of a joined table; the image variants need the instance.
+    """
+    # Output key -> values() lookup
+    lookups = {
+        'id': 'id',
+        'name': 'name',
+        'description': 'description',
+        'manufacturer': 'manufacturer__name',
+        'category': 'category__name',
+        'price': 'price',
+        'value': 'value',
+        'unit': 'unit',
+        'manufacturing_date': 'manufacturing_date',
+        'expired_date': 'expired_date',
+        'image': 'image',
+        'rank': 'search_rank',
+        'snippet': 'search_snippet',
+    }
+    formatters = {
+        'value': lambda value: '{:f}'.format(value.quantize(CENTS)) if value is not None else None,
+        'manufacturing_date': format_date,
+        'expired_date': format_date,
+        'image': format_image,
+        'snippet': format_snippet,
+    }
+
+    def __init__(self, fields):
+        self.fields = [field for field in PRODUCT_FIELDS if field in fields]
+
+    @classmethod
+    def supports(cls, fields):
+        return set(fields) <= set(cls.lookups)
+
+    def get_lookups(self):
+        return [self.lookups[field] for field in self.fields]
+
+    def to_representation(self, row):
+        representation = {}
+        for field in self.fields:
+            lookup = self.lookups[field]
+            if lookup not in row:
+                # rank and snippet outside a search
+                continue
+            value = row[lookup]
+            formatter = self.formatters.get(field)
+            representation[field] = formatter(value) if formatter else value
         return representation
 
+
+# Model columns each output key reads, for only() on the instance path
+PRODUCT_FIELD_COLUMNS = {
+    'manufacturer': ['manufacturer__name'],
+    'category': ['category__name'],
+    'image_variants': ['image', 'image_variants'],
+    'image_srcset': ['image', 'image_variants'],
+    'rank': [],
+    'snippet': [],
+}
+
+
+def get_ordering_fields(queryset):
+    fields = []
+    for item in queryset.query.order_by:
+        if isinstance(item, str) and item != '?':
+            name = item.lstrip('-')
+            fields.append('id' if name == 'pk' else name)
+    return fields
+
+
+def project_products(queryset, fields):
+    """
+    Narrow a product queryset to what rendering ``fields`` reads: ``values()``
+    rows when ``ProductValuesSerializer`` covers them, otherwise instances
+    loading only the needed columns. The ordering columns are kept for the
+    cursor pagination. ``fields=None`` leaves the queryset as it is.
+    """
+    if fields is None:
+        return queryset
+    extra = ['id', *get_ordering_fields(queryset)]
+    annotations = queryset.query.annotations
+    if ProductValuesSerializer.supports(fields):
+        lookups = [
+            lookup for lookup in ProductValuesSerializer(fields).get_lookups()
+            if not lookup.startswith('search_') or lookup in annotations
+        ]
+        return queryset.values(*dict.fromkeys(lookups + extra))
+
+    columns = [column for field in fields for column in PRODUCT_FIELD_COLUMNS.get(field, [field])]
+    columns += [field for field in extra if field not in annotations]
+    relations = [relation for relation in ('manufacturer', 'category') if f'{relation}__name' in columns]
+    return queryset.select_related(None).select_related(*relations).only(*dict.fromkeys(columns))
+
+
+def serialize_products(products, fields, many=True):
+    """
+    Render products fetched through ``project_products``.
+    """
+    rows = products if many else [products]
+    if rows and isinstance(rows[0], dict):
+        serializer = ProductValuesSerializer(fields)
+        with measure_serialization():
+            data = [serializer.to_representation(row) for row in rows]
+        return data if many else data[0]
+    return ProductsSerializer(products, many=many, fields=fields).data
+
+
 class ProductsCreateSerializer(ModelSerializer):
     class Meta:
         model = Product
         fields = ['name','description','manufacturer','category','price','value','unit','manufacturing_date','expired_date', 'image']
 
 
+class ProductsImportSerializer(ProductsCreateSerializer):
+    id = serializers.IntegerField(required=False, min_value=1)
+    manufacturer = serializers.CharField(source='manufacturer_id')
+    category = serializers.CharField(source='category_id', required=False, allow_null=True)
+    image = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+    class Meta(ProductsCreateSerializer.Meta):
+        fields = ['id'] + ProductsCreateSerializer.Meta.fields
+
+    def validate_manufacturer(self, value):
+        try:
+            return self.context['manufacturers'][value]
+        except KeyError:
+            raise serializers.ValidationError(f'Unknown manufacturer "{value}"')
+
+    def validate_category(self, value):
+        if value is None:
+            return None
+        try:
+            return self.context['categories'][value]
+        except KeyError:
+            raise serializers.ValidationError(f'Unknown category "{value}"')
+
+    def validate_image(self, value):
+        # Only a blob already uploaded can be referenced; paths are never taken as given
+        if value and not (is_blob(value) and default_storage.exists(value)):
+            raise serializers.ValidationError(f'"{value}" is not a stored image')
+        return value
+
+
 class UserSerializer(ModelSerializer):
     class Meta:
         model = Customer
@@ -70,7 +263,7 @@ class UserCreateSerializer(ModelSerializer):
 class OrderSerializer(ModelSerializer):
     class Meta:
         model = Order
-        fields = ['id','product','customer','phone_customer','status','delivery_address','final_price']
+        fields = ['id','product','quantity','customer','phone_customer','status','delivery_address','final_price']
 
     def to_representation(self, instance) -> dict:
         representation = super().to_representation(instance)
@@ -98,13 +291,25 @@ class OrderCreateSerializer(ModelSerializer):
         fields = ['product','delivery_address',]
 
 
+class CartItemSerializer(Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=1000, default=1)
 
-    def create(self,validated_data):
-        instance = super().create(validated_data)
-        instance.customer = self.context.get('request').user
-        instance.final_price = self.context.get('final_price')
-        instance.save()
-        return instance
+
+class CartCheckoutSerializer(Serializer):
+    items = CartItemSerializer(many=True, allow_empty=False, max_length=200)
+    delivery_address = serializers.CharField(max_length=100)
+
+    def validate_items(self, items):
+        # Price the whole basket with one query, along with the keys the sales summaries need
+        ids = {item['product'] for item in items}
+        products = Product.objects.only('id', 'name', 'price', 'category_id', 'manufacturer_id').in_bulk(ids)
+        missing = sorted(ids - set(products))
+        if missing:
+            raise serializers.ValidationError(f'Unknown products: {", ".join(map(str, missing))}')
+        for item in items:
+            item['product'] = products[item['product']]
+        return items
 
 
 
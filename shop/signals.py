@@ -0,0 +1,107 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .analytics import get_state, get_stored_state, move_products, record_change
+from .authentication import TOKEN_CLAIMS, revoke_tokens
+from .cache import bump_version
+from .models import Category, Country, Customer, Manufacturer, Order, Product
+from .storage import acquire, get_variant_names, release
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Country)
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=Manufacturer)
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_version(sender)
+
+
+# The Product columns the post_save handlers compare with their previous values
+TRACKED_FIELDS = {'image', 'category', 'category_id', 'manufacturer', 'manufacturer_id'}
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_product(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None or (update_fields is not None and not TRACKED_FIELDS & set(update_fields)):
+        return
+    instance._previous = sender.objects.filter(pk=instance.pk).values_list(
+        'image', 'image_variants', 'category_id', 'manufacturer_id'
+    ).first()
+
+
+@receiver(post_save, sender=Product)
+def count_image_references(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        acquire(instance.image.name)
+        return
+    previous = getattr(instance, '_previous', None)
+    saved = update_fields is None or 'image' in update_fields
+    if previous and saved and previous[0] != instance.image.name:
+        acquire(instance.image.name)
+        # The variants of the replaced image go with it
+        release(previous[0], *get_variant_names(*previous[:2]))
+
+
+@receiver(post_save, sender=Product)
+def move_sales_summary(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if raw or created or not previous:
+        return
+    category_id, manufacturer_id = previous[2:]
+    # Fields left out of update_fields keep their stored value
+    if update_fields is None or {'category', 'category_id'} & set(update_fields):
+        category_id = instance.category_id
+    if update_fields is None or {'manufacturer', 'manufacturer_id'} & set(update_fields):
+        manufacturer_id = instance.manufacturer_id
+    move_products({instance.pk: (tuple(previous[2:]), (category_id, manufacturer_id))})
+
+
+@receiver(post_delete, sender=Product)
+def release_deleted_image(sender, instance, **kwargs):
+    release(instance.image.name, *get_variant_names(instance.image.name, instance.image_variants))
+
+
+@receiver(pre_save, sender=Order)
+def remember_previous_order(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None if raw or instance.pk is None else get_stored_state(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_sales_summary(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_state', None)
+    record_change(before=[previous] if previous else [], after=[get_state(instance)])
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_sales_summary(sender, instance, **kwargs):
+    record_change(before=[get_state(instance)])
+
+
+# The Customer columns bearer tokens depend on; see shop/authentication.py
+TOKEN_DEPENDENCIES = [*TOKEN_CLAIMS.values(), 'is_active', 'password']
+
+
+@receiver(pre_save, sender=Customer)
+def remember_token_dependencies(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None or (update_fields is not None and not set(TOKEN_DEPENDENCIES) & set(update_fields)):
+        return
+    instance._previous_tokens = sender.objects.filter(pk=instance.pk).values_list(*TOKEN_DEPENDENCIES).first()
+
+
+@receiver(post_save, sender=Customer)
+def revoke_outdated_tokens(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_tokens', None)
+    instance._previous_tokens = None
+    if previous and previous != tuple(getattr(instance, field) for field in TOKEN_DEPENDENCIES):
+        revoke_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Customer)
+def revoke_deleted_tokens(sender, instance, **kwargs):
+    revoke_tokens(instance.pk)
@@ -0,0 +1,38 @@
+ORDER_BY_PARAM = 'order_by'
+
+
+class SortKeys:
+    """
+    The ``order_by`` values a list view accepts, each mapped to the ordering
+    an index of the table serves. ``-key`` reverses every field of ``key``, so
+    the same index is scanned backwards.
+
+    ``id`` is appended as the last field, which makes every ordering total:
+    ``KeysetPagination`` reads it off the queryset as the cursor key unchanged.
+    Anything not declared, relation traversals included, is rejected before a
+    query is built.
+    """
+    def __init__(self, **keys):
+        self.keys = {key: (fields,) if isinstance(fields, str) else tuple(fields) for key, fields in keys.items()}
+
+    @property
+    def choices(self):
+        return [choice for key in self.keys for choice in (key, f'-{key}')]
+
+    def get_ordering(self, value):
+        desc = value.startswith('-')
+        fields = self.keys.get(value[1:] if desc else value)
+        if fields is None:
+            raise ValueError(f'{ORDER_BY_PARAM} must be one of: {", ".join(self.choices)}')
+        if 'id' not in fields:
+            fields = (*fields, 'id')
+        return [f'-{field}' if desc else field for field in fields]
+
+    def apply(self, queryset, params):
+        """
+        Order ``queryset`` by the ``order_by`` of the query ``params``, if any.
+        Raises ValueError on an undeclared key.
+        """
+        if ORDER_BY_PARAM not in params.keys():
+            return queryset
+        return queryset.order_by(*self.get_ordering(params.get(ORDER_BY_PARAM).strip()))
@@ -0,0 +1,99 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+
+PHASE_MARKER = 'shop-startup-phase:'
+
+# Runs in a fresh interpreter: load the WSGI app, then time the first hit on each
+# path, marking on stderr which phase the following -X importtime lines belong to
+PROBE = f'''
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+timings = {{}}
+sys.stderr.write('{PHASE_MARKER} load\\n')
+started = time.perf_counter()
+from api.wsgi import app
+timings['load'] = time.perf_counter() - started
+for path in sys.argv[1:]:
+    environ = {{'PATH_INFO': path}}
+    setup_testing_defaults(environ)
+    statuses = []
+    sys.stderr.write('{PHASE_MARKER} ' + path + '\\n')
+    started = time.perf_counter()
+    b''.join(app(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+    timings[path] = {{'status': int(statuses[0][:3]), 'seconds': time.perf_counter() - started}}
+print(json.dumps(timings))
+'''
+
+
+class LazyView:
+    """
+    URL callback that imports its view on the first request routed to it, so a
+    cold start only loads the modules of the routes it actually serves.
+    """
+    def __init__(self, dotted_path, **initkwargs):
+        self.dotted_path = dotted_path
+        self.initkwargs = initkwargs
+
+    @cached_property
+    def view(self):
+        view = import_string(self.dotted_path)
+        return view.as_view(**self.initkwargs) if isinstance(view, type) else view
+
+    def __call__(self, request, *args, **kwargs):
+        return self.view(request, *args, **kwargs)
+
+    def __getattr__(self, name):
+        # csrf_exempt, cls, initkwargs... are read from the view once it is needed
+        if name == 'view':
+            raise AttributeError(name)
+        return getattr(self.view, name)
+
+
+def run_probe(paths, env=None, importtime=False):
+    """
+    Start a fresh interpreter, load ``api.wsgi`` and request ``paths`` once.
+
+    Returns the timings and, with ``importtime``, the ``-X importtime`` records
+    of each phase as ``(self_us, cumulative_us, depth, module)`` tuples.
+    """
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', PROBE, *paths]
+    process = subprocess.run(
+        command, env={**os.environ, **(env or {})}, cwd=settings.BASE_DIR, capture_output=True, text=True,
+    )
+    if process.returncode:
+        raise RuntimeError(process.stderr)
+    return json.loads(process.stdout), parse_importtime(process.stderr)
+
+
+def parse_importtime(output):
+    phases = defaultdict(list)
+    phase = 'interpreter'
+    for line in output.splitlines():
+        if line.startswith(PHASE_MARKER):
+            phase = line[len(PHASE_MARKER):].strip()
+        elif line.startswith('import time:') and '|' in line:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            if not self_us.strip().isdigit():
+                continue
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            phases[phase].append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return dict(phases)
+
+
+def rank_packages(records):
+    """
+    Sum the self time of ``records`` per top-level package, slowest first.
+    """
+    totals = defaultdict(int)
+    for self_us, _, _, name in records:
+        totals[name.split('.')[0]] += self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,202 @@
+import fcntl
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
+from django.views.static import serve
+
+
+BLOB_NAME = re.compile(r'^(?:[^/]+/)?[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after the SHA-256 of its content.
+
+    The upload is hashed while it is streamed to a temporary file, which is then
+    moved to ``<top directory>/<2 hex>/<digest><ext>``. An identical upload finds
+    its blob already there and is stored once. Names never collide, so they
+    never get suffixes, and a URL only ever maps to one content.
+    """
+    chunk_size = 64 * 1024
+    incoming_dir = '.incoming'
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        directory = name.split('/', 1)[0] if '/' in name else ''
+        extension = os.path.splitext(name)[1].lower()
+        incoming = self.path(self.incoming_dir)
+        os.makedirs(incoming, exist_ok=True)
+
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=incoming, delete=False) as temporary:
+            try:
+                for chunk in content.chunks(self.chunk_size):
+                    digest.update(chunk)
+                    temporary.write(chunk)
+            except BaseException:
+                os.remove(temporary.name)
+                raise
+
+        digest = digest.hexdigest()
+        blob = posixpath.join(directory, digest[:2], f'{digest}{extension}')
+        path = self.path(blob)
+        with self.lock():
+            if os.path.exists(path):
+                # A newer mtime than its release keeps delete_unreferenced off it
+                os.utime(path)
+                os.remove(temporary.name)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temporary.name, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+        return blob
+
+    @contextmanager
+    def lock(self):
+        """
+        Hold the lock every process on the host takes to store or delete a blob.
+        """
+        incoming = self.path(self.incoming_dir)
+        os.makedirs(incoming, exist_ok=True)
+        with open(os.path.join(incoming, '.lock'), 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def delete_released(self, name, released_at):
+        """
+        Delete ``name`` unless it was stored again after ``released_at`` (in
+        nanoseconds), under the lock ``_save`` holds to reuse an existing blob.
+        """
+        with self.lock():
+            try:
+                stored_again = os.stat(self.path(name)).st_mtime_ns > released_at
+            except FileNotFoundError:
+                return
+            if not stored_again:
+                self.delete(name)
+
+
+def is_blob(name):
+    return bool(BLOB_NAME.match(name or ''))
+
+
+def get_variant_names(image, variants):
+    """
+    The stored names of the variants in ``variants`` that were rendered from
+    ``image``. Variants of an earlier image were released when it was replaced.
+    """
+    variants = variants or {}
+    if not image or variants.get('source') != image:
+        return []
+    return [
+        name for variant in variants.values() if isinstance(variant, dict)
+        for name in variant.values() if isinstance(name, str)
+    ]
+
+
+def acquire(*names):
+    """
+    Count one more reference to each blob in ``names``, in the current transaction.
+    """
+    from .models import BlobReference
+
+    for name, count in Counter(name for name in names if is_blob(name)).items():
+        if BlobReference.objects.filter(name=name).update(references=F('references') + count):
+            continue
+        _, created = BlobReference.objects.get_or_create(name=name, defaults={'references': count})
+        if not created:
+            # Inserted by a concurrent transaction since the update above
+            BlobReference.objects.filter(name=name).update(references=F('references') + count)
+
+
+def release(*names):
+    """
+    Drop one reference to each blob in ``names`` in the current transaction,
+    and delete the blobs left without references once it commits.
+    """
+    from .models import BlobReference
+
+    counts = Counter(name for name in names if is_blob(name))
+    for name, count in counts.items():
+        BlobReference.objects.filter(name=name).update(references=F('references') - count)
+    if counts:
+        released_at = time.time_ns()
+        transaction.on_commit(lambda: delete_unreferenced(counts, released_at))
+
+
+def delete_unreferenced(names, released_at=None):
+    """
+    Delete the blobs in ``names`` that are still without references.
+
+    The count is checked again in the transaction that deletes the row. A
+    blob stored again since ``released_at`` is about to be referenced by a
+    transaction that has not committed yet, so its file stays.
+    """
+    from .models import BlobReference
+
+    released_at = released_at or time.time_ns()
+    for name in names:
+        with transaction.atomic():
+            # Removing the row first makes a concurrent acquire wait for, or
+            # create a fresh count after, this delete instead of racing it
+            if not BlobReference.objects.filter(name=name, references__lte=0).delete()[0]:
+                continue
+            if isinstance(default_storage, ContentAddressedStorage):
+                default_storage.delete_released(name, released_at)
+            else:
+                default_storage.delete(name)
+
+
+def get_reference_counts(products):
+    """
+    Count the blob references of ``(image, image_variants)`` pairs, as
+    ``acquire`` and ``release`` keep them.
+    """
+    counts = Counter()
+    for image, variants in products:
+        counts.update(name for name in [image, *get_variant_names(image, variants)] if is_blob(name))
+    return counts
+
+
+def get_referenced_names():
+    from .models import Product
+
+    names = set()
+    for image, variants in Product.objects.values_list('image', 'image_variants').iterator():
+        names.add(image)
+        for variant in (variants or {}).values():
+            if isinstance(variant, dict):
+                names.update(value for value in variant.values() if isinstance(value, str))
+    return names
+
+
+def serve_media(request, path):
+    """
+    Serve MEDIA_ROOT files; content-addressed blobs are cached forever.
+    Uploads still being hashed are never served.
+    """
+    if path.split('/', 1)[0] == ContentAddressedStorage.incoming_dir:
+        raise Http404
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_blob(path) and response.status_code == 200:
+        response['Cache-Control'] = IMMUTABLE
+        response['ETag'] = f'"{os.path.splitext(os.path.basename(path))[0]}"'
+    return response
@@ -1,3 +1,808 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import skipIf
+from urllib.parse import urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .analytics import COLUMNS, get_summary, rebuild_summaries
+from .authentication import BearerTokenAuthentication, issue_token
+from .cache import bump_version, get_cache, get_stats, hits, misses
+from .images import store_variants
+from .importers import ProductImporter, read_csv
+from .metrics import registry
+from .serializers import ProductValuesSerializer, ProductsSerializer
+from .storage import ContentAddressedStorage, acquire, release
+from .models import *
+
+
+def create_products(count, **kwargs):
+    country = Country.objects.create(name='Country')
+    manufacturer = Manufacturer.objects.create(name='Manufacturer', country=country, address='-', email='m@example.com')
+    category = Category.objects.create(name='Category')
+    today = timezone.localdate()
+    fields = {
+        'description': '', 'image': 'products/test.jpg', 'manufacturer': manufacturer, 'category': category,
+        'price': 10, 'value': 1, 'unit': 'piece',
+        'manufacturing_date': today, 'expired_date': today + datetime.timedelta(days=30),
+        **kwargs,
+    }
+    return [Product.objects.create(name=f'Product {number}', **fields) for number in range(count)]
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def walk(self, url, max_pages=50):
+        ids = []
+        for _ in range(max_pages):
+            if not url:
+                return ids
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.json()['results']]
+            next_url = response.json()['next']
+            url = next_url and urlsplit(next_url)._replace(scheme='', netloc='').geturl()
+        self.fail(f'Still paging after {max_pages} pages, {len(ids)} rows')
+
+    def test_walk_visits_every_row_once(self):
+        products = create_products(7)
+        Product.objects.filter(id__in=[products[1].id, products[4].id]).update(price=5)
+        for order_by in ('id', '-id', 'price', '-price', 'name'):
+            ids = self.walk(f'/api/products?page_size=2&order_by={order_by}')
+            self.assertEqual(sorted(ids), sorted(product.id for product in products), order_by)
+
+    def test_walk_over_datetimes_less_than_a_millisecond_apart(self):
+        products = create_products(12)
+        started = timezone.now().replace(microsecond=0)
+        for number, product in enumerate(products):
+            # Pairs share a timestamp, neighbours are 100 microseconds apart
+            updated_at = started + datetime.timedelta(microseconds=100 * (number // 2))
+            Product.objects.filter(id=product.id).update(updated_at=updated_at)
+
+        for order_by in ('updated_at', '-updated_at'):
+            ids = self.walk(f'/api/products?page_size=2&order_by={order_by}')
+            self.assertEqual(len(ids), len(products), order_by)
+            self.assertEqual(set(ids), {product.id for product in products}, order_by)
+
+    def test_invalid_cursor(self):
+        create_products(1)
+        self.assertEqual(self.client.get('/api/products?cursor=garbage').status_code, 404)
+
+
+class SearchTests(TestCase):
+    def test_snippet_escapes_product_text(self):
+        create_products(1, description='Fresh <script>alert(1)</script> milk & honey')
+        for fields in ('', '&fields=id,snippet'):
+            response = APIClient().get(f'/api/products?search=milk{fields}')
+            self.assertEqual(response.status_code, 200)
+            snippet = response.json()['results'][0]['snippet']
+            self.assertNotIn('<script>', snippet)
+            self.assertIn('&lt;script&gt;', snippet)
+            self.assertIn('<mark>milk</mark>', snippet)
+
+
+def create_customer(email='customer@example.com', **kwargs):
+    return Customer.objects.create_user(email, 'password', phone=email, **kwargs)
+
+
+class ConditionalGetTests(TestCase):
+    def assertNotModified(self, client, url):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        return etag
+
+    def test_products_list(self):
+        client = APIClient()
+        products = create_products(3)
+        for url in ('/api/products?page_size=2', '/api/products?facets=1', f'/api/products?ids={products[0].id}'):
+            etag = self.assertNotModified(client, url)
+            products[1].price += 1
+            products[1].save()
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag, url)
+
+    def test_products_list_changes_with_a_category_rename(self):
+        client = APIClient()
+        products = create_products(1)
+        etag = self.assertNotModified(client, '/api/products')
+        products[0].category.name = 'Renamed'
+        products[0].category.save()
+        self.assertEqual(client.get('/api/products', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_orders_list(self):
+        client = APIClient()
+        customer = create_customer()
+        client.force_authenticate(customer)
+        product = create_products(1)[0]
+        Order.objects.create(product=product, customer=customer, delivery_address='-')
+        etag = self.assertNotModified(client, '/api/orders')
+        Order.objects.create(product=product, customer=customer, delivery_address='-')
+        response = client.get('/api/orders', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+        # Another customer never gets the first one's ETag
+        other = APIClient()
+        other.force_authenticate(create_customer('other@example.com'))
+        self.assertNotEqual(other.get('/api/orders')['ETag'], response['ETag'])
+
+    def test_orders_list_with_a_token(self):
+        client = APIClient()
+        customer = create_customer()
+        product = create_products(1)[0]
+        Order.objects.create(product=product, customer=customer, delivery_address='-')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_token(customer)}')
+        etag = self.assertNotModified(client, '/api/orders')
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/orders', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        customer.email = 'renamed@example.com'
+        customer.save()
+        response = client.get('/api/orders', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['customer'], 'renamed@example.com')
+
+    def test_orders_search(self):
+        client = APIClient()
+        customer = create_customer()
+        client.force_authenticate(customer)
+        products = create_products(2)
+        for product in products:
+            Order.objects.create(product=product, customer=customer, delivery_address='-')
+        response = client.get('/api/orders?search=product 1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['product'] for order in response.json()['results']], ['Product 1'])
+
+
+class CachedResponseTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        hits.clear()
+        misses.clear()
+        self.client = APIClient()
+
+    def get_names(self, url='/api/category'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache'], [row['name'] for row in response.json()['results']]
+
+    def test_writes_invalidate_cached_responses(self):
+        Category.objects.create(name='First')
+        self.assertEqual(self.get_names(), ('MISS', ['First']))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_names(), ('HIT', ['First']))
+
+        # A model save bumps the version through the signals
+        Category.objects.create(name='Second')
+        self.assertEqual(self.get_names(), ('MISS', ['First', 'Second']))
+
+        # So does a write through the API
+        self.client.force_authenticate(create_customer(is_staff=True))
+        self.assertEqual(self.client.post('/api/category', {'name': 'Third'}).status_code, 201)
+        self.assertEqual(self.get_names(), ('MISS', ['First', 'Second', 'Third']))
+
+        # Bulk updates send no signals and bump the version themselves
+        Category.objects.update(name='Renamed')
+        self.assertEqual(self.get_names()[0], 'HIT')
+        bump_version(Category)
+        self.assertEqual(self.get_names(), ('MISS', ['Renamed'] * 3))
+
+        # Other models leave it alone, and so does another URL
+        Country.objects.create(name='Country')
+        self.assertEqual(self.get_names()[0], 'HIT')
+        self.assertEqual(self.get_names('/api/category?order_by=-id')[0], 'MISS')
+
+    def test_counters(self):
+        Category.objects.create(name='First')
+        for _ in range(3):
+            self.get_names()
+        # Errors are counted as misses and never cached
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/category?order_by=bogus').status_code, 400)
+        self.assertEqual(get_stats(), {'CategoryApiView': {'hits': 2, 'misses': 3}})
+
+        self.client.force_authenticate(create_customer(is_staff=True))
+        self.assertEqual(self.client.get('/api/cache').json(), {'CategoryApiView': {'hits': 2, 'misses': 3}})
+
+
+class BearerTokenTests(TestCase):
+    def setUp(self):
+        self.customer = create_customer()
+        self.client = APIClient()
+
+    def get_profile(self, token):
+        return self.client.get('/api/profile', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_sign_in_issues_a_working_token(self):
+        response = self.client.post('/api/sign_in', {'username': self.customer.email, 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+        profile = self.get_profile(response.json()['token'])
+        self.assertEqual(profile.status_code, 200)
+        self.assertEqual(profile.json()['email'], self.customer.email)
+
+    def test_authentication_does_not_query(self):
+        request = RequestFactory().get('/api/profile', HTTP_AUTHORIZATION=f'Bearer {issue_token(self.customer)}')
+        with self.assertNumQueries(0):
+            customer, _ = BearerTokenAuthentication().authenticate(request)
+            self.assertEqual((customer.pk, customer.phone, customer.is_staff), (self.customer.pk, self.customer.phone, False))
+
+    def test_rejects_tampered_and_expired_tokens(self):
+        self.assertEqual(self.get_profile(issue_token(self.customer) + 'x').status_code, 401)
+        with override_settings(SHOP_TOKEN_LIFETIME=0):
+            token = issue_token(self.customer)
+        self.assertEqual(self.get_profile(token).status_code, 401)
+
+    def test_sign_out_revokes_every_token(self):
+        first, second = issue_token(self.customer), issue_token(self.customer)
+        response = self.client.get('/api/sign_out', HTTP_AUTHORIZATION=f'Bearer {first}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_profile(first).status_code, 401)
+        self.assertEqual(self.get_profile(second).status_code, 401)
+        self.assertEqual(self.get_profile(issue_token(self.customer)).status_code, 200)
+
+    def test_changed_flags_revoke_tokens(self):
+        token = issue_token(self.customer)
+        self.customer.first_name = 'Renamed'
+        self.customer.save()
+        self.assertEqual(self.get_profile(token).status_code, 200)
+
+        self.customer.is_staff = True
+        self.customer.save()
+        self.assertEqual(self.get_profile(token).status_code, 401)
+        token = issue_token(self.customer)
+        self.assertEqual(self.client.get('/api/cache', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.get_profile(token).status_code, 401)
+
+    def test_phone_change_returns_a_new_token(self):
+        token = issue_token(self.customer)
+        response = self.client.patch('/api/profile', {'phone': '5550100'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_profile(token).status_code, 401)
+        self.assertEqual(self.get_profile(response.json()['token']).json()['phone'], '5550100')
+
+
+def use_temporary_media(test):
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    storage = override_settings(MEDIA_ROOT=media_root, DEFAULT_FILE_STORAGE='shop.storage.ContentAddressedStorage')
+    storage.enable()
+    test.addCleanup(storage.disable)
+
+
+class BlobReferenceTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+
+    def test_shared_blob_is_deleted_with_its_last_product(self):
+        first, second = create_products(2)
+        for product in (first, second):
+            product.image = ContentFile(b'same content', name='photo.jpg')
+            product.save()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(BlobReference.objects.get(name=first.image.name).references, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.image.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(second.image.name))
+        self.assertFalse(BlobReference.objects.exists())
+
+    def test_replacing_an_image_releases_its_variants(self):
+        product = create_products(1)[0]
+        product.image = ContentFile(b'first', name='photo.jpg')
+        product.save()
+        rendered = {'thumb': {'width': 1, 'height': 1, 'files': {'webp': b'thumb webp', 'jpeg': b'thumb jpeg'}}}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(store_variants(product.id, product.image.name, rendered), 1)
+        product.refresh_from_db()
+        old = [product.image.name, product.image_variants['thumb']['webp'], product.image_variants['thumb']['jpeg']]
+        self.assertTrue(all(default_storage.exists(name) for name in old))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = ContentFile(b'second', name='photo.jpg')
+            product.save()
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+        self.assertTrue(default_storage.exists(product.image.name))
+
+        # Variants rendered for the replaced image are not kept
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(store_variants(product.id, old[0], rendered), 0)
+        self.assertFalse(any(default_storage.exists(name) for name in old[1:]))
+
+    def test_blob_stored_again_after_its_release_is_kept(self):
+        product = create_products(1)[0]
+        product.image = ContentFile(b'content', name='photo.jpg')
+        product.save()
+        name = product.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.delete()
+        # An upload of the same content lands before the release commits
+        self.assertEqual(default_storage.save('products/again.jpg', ContentFile(b'content')), name)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(default_storage.exists(name))
+
+        # The upload's reference commits; released with nothing stored since, the blob goes
+        acquire(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            release(name)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_incoming_uploads_are_not_served(self):
+        default_storage.save('products/photo.jpg', ContentFile(b'content'))
+        incoming = os.path.join(settings.MEDIA_ROOT, ContentAddressedStorage.incoming_dir)
+        with open(os.path.join(incoming, 'partial'), 'wb') as file:
+            file.write(b'partial')
+        client = APIClient()
+        self.assertEqual(client.get('/media/.incoming/partial').status_code, 404)
+        self.assertEqual(client.get('/media/.incoming/.lock').status_code, 404)
+
+
+class SalesSummaryTests(TestCase):
+    def get_summaries(self):
+        # Rows emptied by a delete stay behind with zero totals; a rebuild does not write them
+        return sorted(SalesSummary.objects.exclude(orders=0).values_list('dimension', 'key', 'day', *COLUMNS))
+
+    def assertMatchesRebuild(self):
+        incremental = self.get_summaries()
+        rebuild_summaries()
+        self.assertEqual(incremental, self.get_summaries())
+
+    def test_checkout_writes_gross_revenue_in_one_upsert(self):
+        customer = create_customer(wallet=50)
+        products = create_products(30, price=10)
+        client = APIClient()
+        client.force_authenticate(customer)
+        items = [{'product': product.id, 'quantity': 2} for product in products]
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/api/orders/checkout', {'items': items, 'delivery_address': '-'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        upserts = [query for query in queries if 'shop_salessummary' in query['sql']]
+        self.assertEqual(len(upserts), 1)
+        # Basket lookup, wallet charge, order insert and summary upsert, whatever the basket size
+        self.assertLessEqual(len(queries), 8)
+
+        category = SalesSummary.objects.get(dimension='category', key=products[0].category_id)
+        self.assertEqual((category.orders, category.quantity, category.revenue), (30, 60, 600))
+        self.assertMatchesRebuild()
+
+    def test_order_changes_and_product_moves(self):
+        customer = create_customer()
+        first, second = create_products(2, price=10)
+        order = Order.objects.create(product=first, customer=customer, delivery_address='-', quantity=3)
+        Order.objects.create(product=second, customer=customer, delivery_address='-')
+        order.status = 'delivery'
+        order.save()
+        self.assertMatchesRebuild()
+
+        first.category = Category.objects.create(name='Other')
+        first.save()
+        self.assertMatchesRebuild()
+
+        order.delete()
+        self.assertMatchesRebuild()
+
+    def test_day_group_is_limited(self):
+        customer = create_customer()
+        for product in create_products(3):
+            Order.objects.create(product=product, customer=customer, delivery_address='-')
+        today = timezone.localdate()
+        self.assertEqual(len(get_summary('product', today, today, limit=2)), 2)
+
+    def test_limit_must_be_positive(self):
+        client = APIClient()
+        client.force_authenticate(create_customer(is_staff=True))
+        for limit in ('-1', '0', 'many'):
+            self.assertEqual(client.get(f'/api/analytics/sales/product?limit={limit}').status_code, 400, limit)
+        self.assertEqual(client.get('/api/analytics/sales/product?limit=1').status_code, 200)
+
+
+class ExpiryTests(TestCase):
+    def test_categories_count_only_the_window(self):
+        today = timezone.localdate()
+        products = create_products(4)
+        for product, offset in zip(products, (-30, -3, 0, 3)):
+            product.expired_date = today + datetime.timedelta(days=offset)
+            product.save()
+        response = APIClient().get('/api/products/expiring/categories?days=7')
+        self.assertEqual(response.status_code, 200)
+        [row] = response.json()['results']
+        self.assertEqual((row['expired'], row['expiring']), (1, 2))
+
+        products[0].expired_date = today - datetime.timedelta(days=1)
+        products[0].save()
+        [row] = APIClient().get('/api/products/expiring/categories?days=7').json()['results']
+        self.assertEqual((row['expired'], row['expiring']), (2, 2))
+
+
+@override_settings(MIDDLEWARE=['shop.metrics.MetricsMiddleware', *settings.MIDDLEWARE])
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.client = APIClient()
+
+    def get_timings(self, response):
+        timings = {}
+        for item in response['Server-Timing'].split(', '):
+            name, *params = item.split(';')
+            timings[name] = dict(param.split('=', 1) for param in params)
+        return timings
+
+    def get_histogram(self, metric, route):
+        return registry.histograms[(metric, route, 'GET')]
+
+    def test_server_timing_counts_the_queries(self):
+        create_products(3)
+        for url in ('/api/products', '/api/products?fields=id,name,manufacturer'):
+            registry.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            timings = self.get_timings(response)
+            self.assertEqual(set(timings), {'db', 'serializer', 'view', 'total'})
+            self.assertEqual(timings['db']['desc'], f'"{len(queries)} queries"', url)
+            self.assertEqual(self.get_histogram('queries', '/api/products').sum, len(queries), url)
+            # The values() fast path is timed as serialization too
+            self.assertGreater(self.get_histogram('serializer', '/api/products').sum, 0, url)
+
+    def test_streamed_exports_are_measured_to_the_end(self):
+        create_products(3)
+        self.client.force_authenticate(create_customer(is_staff=True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/export?format=csv')
+            self.assertNotIn(('queries', '/api/products/export', 'GET'), registry.histograms)
+            body = b''.join(response.streaming_content)
+        self.assertEqual(len(body.splitlines()), 4)
+        self.assertEqual(self.get_histogram('queries', '/api/products/export').sum, len(queries))
+        self.assertGreater(self.get_histogram('serializer', '/api/products/export').sum, 0)
+        self.assertIn('shop_db_queries_count{route="/api/products/export",method="GET"} 1', registry.export())
+
+
+class RendererTests(TestCase):
+    def test_negotiation(self):
+        create_products(1)
+        client = APIClient()
+        for accept, content_type in (
+            ('*/*', 'application/json'),
+            ('application/json', 'application/json'),
+            ('application/json; encoder=fast', 'application/json; encoder=fast'),
+        ):
+            response = client.get('/api/products', HTTP_ACCEPT=accept)
+            self.assertEqual(response['Content-Type'], content_type, accept)
+            self.assertEqual(len(response.json()['results']), 1, accept)
+
+    def test_unacceptable_falls_back_to_json(self):
+        response = APIClient().get('/api/products', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+CSV_HEADER = 'id,name,description,manufacturer,category,price,value,unit,manufacturing_date,expired_date,image'
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+        self.product, self.named = create_products(2)
+        self.manufacturer = self.product.manufacturer
+        self.category = self.product.category
+
+    def get_rows(self, *rows):
+        lines = [CSV_HEADER] + [','.join(str(value) for value in row) for row in rows]
+        return '\n'.join(lines).encode()
+
+    def row(self, name, price=10, id='', manufacturer='Manufacturer', category='Category', image=''):
+        return [id, name, 'Imported', manufacturer, category, price, 1, 'piece', '2026-01-01', '2099-01-01', image]
+
+    def run_import(self, data, batch_size=None):
+        return ProductImporter(batch_size=batch_size).run(read_csv(io.BytesIO(data).readlines()))
+
+    def test_rows_create_or_update_by_key(self):
+        other = Manufacturer.objects.create(name='Other', country=self.manufacturer.country, address='-', email='o@example.com')
+        report = self.run_import(self.get_rows(
+            # Same name and manufacturer, by id, then a new name and a name of another manufacturer
+            self.row('Product 1', price=11),
+            self.row('Renamed', price=12, id=self.product.id, manufacturer=self.manufacturer.id),
+            self.row('New', price=13, category=''),
+            self.row('Product 0', price=14, manufacturer='Other', category=self.category.id),
+        ))
+        self.assertEqual((report['created'], report['updated'], report['error_count']), (2, 2, 0))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.price), ('Renamed', 12))
+        self.named.refresh_from_db()
+        self.assertEqual(self.named.price, 11)
+        new = Product.objects.get(name='New')
+        self.assertEqual((new.manufacturer_id, new.category_id, new.price), (self.manufacturer.id, None, 13))
+        self.assertEqual(Product.objects.get(manufacturer=other).category_id, self.category.id)
+
+    def test_batch_boundaries(self):
+        rows = [self.row(f'Batch {number}', price=number + 1) for number in range(5)]
+        # Repeats land in a later batch than the row that created them, and in the same one
+        rows += [self.row('Batch 0', price=100), self.row('Batch 6', price=1), self.row('Batch 6', price=2)]
+        report = self.run_import(self.get_rows(*rows), batch_size=2)
+        self.assertEqual((report['created'], report['updated'], report['error_count']), (6, 1, 0))
+        prices = dict(Product.objects.filter(name__startswith='Batch').values_list('name', 'price'))
+        self.assertEqual(prices, {'Batch 0': 100, 'Batch 1': 2, 'Batch 2': 3, 'Batch 3': 4, 'Batch 4': 5, 'Batch 6': 2})
+
+    def test_errors_are_reported_per_row(self):
+        report = self.run_import(self.get_rows(
+            self.row('Valid'),
+            self.row('Unknown manufacturer', manufacturer='Nobody'),
+            self.row('Unknown category', category='Nothing'),
+            self.row('Bad price', price='cheap'),
+            self.row('Missing', id=999999),
+            self.row('Outside', image='../../settings.py'),
+            self.row('Not stored', image=f'products/ab/{"ab" * 32}.jpg'),
+        ), batch_size=3)
+        self.assertEqual((report['created'], report['updated'], report['error_count']), (1, 0, 6))
+        errors = {error['row']: error['errors'] for error in report['errors']}
+        self.assertEqual(sorted(errors), [2, 3, 4, 5, 6, 7])
+        self.assertIn('manufacturer', errors[2])
+        self.assertIn('category', errors[3])
+        self.assertIn('price', errors[4])
+        self.assertIn('id', errors[5])
+        self.assertIn('image', errors[6])
+        self.assertIn('image', errors[7])
+        self.assertEqual(Product.objects.filter(description='Imported').count(), 1)
+
+    def test_stored_image_is_referenced(self):
+        image = default_storage.save('products/photo.jpg', ContentFile(b'image'))
+        report = self.run_import(self.get_rows(self.row('Pictured', image=image)))
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(Product.objects.get(name='Pictured').image.name, image)
+        self.assertEqual(BlobReference.objects.get(name=image).references, 1)
+
+    def test_endpoint_and_command(self):
+        client = APIClient()
+        client.force_authenticate(create_customer(is_staff=True))
+        response = client.generic('POST', '/api/products/import', self.get_rows(self.row('From API')), content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(client.generic('POST', '/api/products/import', b'{}', content_type='application/json').status_code, 415)
+
+        with tempfile.NamedTemporaryFile(suffix='.ndjson') as stream:
+            stream.write(b'{"name": "From command", "description": "", "manufacturer": "Manufacturer", "price": 5, '
+                         b'"value": 1, "unit": "piece", "manufacturing_date": "2026-01-01", "expired_date": "2099-01-01"}\n'
+                         b'not json\n')
+            stream.flush()
+            output = io.StringIO()
+            call_command('import_products', stream.name, stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual((report['created'], report['error_count'], report['errors'][0]['row']), (1, 1, 2))
+        self.assertTrue(Product.objects.filter(name='From command').exists())
+
+
+class FieldsTests(TestCase):
+    # Every field the values() fast path covers outside a search
+    VALUES_FIELDS = [field for field in ProductValuesSerializer.lookups if field not in ('rank', 'snippet')]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.products = create_products(3, value='1.5')
+        Product.objects.filter(id=self.products[1].id).update(category=None, image='')
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.json()
+
+    def test_unknown_fields_are_rejected(self):
+        product = self.products[0].id
+        for query in ('fields=id,bogus', 'fields=id,password', 'fields=manufacturer__name', 'fields=,'):
+            for url in (f'/api/products?{query}', f'/api/products/{product}?{query}',
+                        f'/api/products?ids={product}&{query}', f'/api/products/expiring?{query}'):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 400, url)
+                self.assertIn('fields', response.json()['message'], url)
+
+    def test_fast_path_matches_the_serializer(self):
+        full = self.get('/api/products')['results']
+        fields = ','.join(self.VALUES_FIELDS)
+        for url in (f'/api/products?fields={fields}', f'/api/products?fields={fields}&order_by=-price'):
+            fast = self.get(url)['results']
+            self.assertEqual(
+                sorted(fast, key=lambda row: row['id']),
+                [{field: row[field] for field in self.VALUES_FIELDS} for row in full],
+                url,
+            )
+        detail = self.get(f'/api/products/{self.products[1].id}')
+        self.assertEqual(self.get(f'/api/products/{self.products[1].id}?fields={fields}'),
+                         {field: detail[field] for field in self.VALUES_FIELDS})
+
+    def test_related_fields_on_the_fast_path(self):
+        with CaptureQueriesContext(connection) as plain:
+            self.get('/api/products?fields=id')
+        with CaptureQueriesContext(connection) as related:
+            rows = self.get('/api/products?fields=id,manufacturer,category')['results']
+        # The names come from joins in the same values() query
+        self.assertEqual(len(related), len(plain))
+        self.assertEqual([row['manufacturer'] for row in rows], ['Manufacturer'] * 3)
+        self.assertEqual([row['category'] for row in rows], ['Category', None, 'Category'])
+        self.assertEqual(set(rows[0]), {'id', 'manufacturer', 'category'})
+
+    def test_instance_fields_keep_their_format(self):
+        serialized = ProductsSerializer(Product.objects.get(id=self.products[0].id), fields=['id', 'image_variants']).data
+        row = self.get(f'/api/products/{self.products[0].id}?fields=id,image_variants')
+        self.assertEqual(row, dict(serialized))
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        first, second = Country.objects.create(name='First'), Country.objects.create(name='Second')
+        self.near = Manufacturer.objects.create(name='Near', country=first, address='-', email='n@example.com')
+        self.far = Manufacturer.objects.create(name='Far', country=second, address='-', email='f@example.com')
+        self.fruit, self.bread = Category.objects.create(name='Fruit'), Category.objects.create(name='Bread')
+        self.country = second
+        rows = [
+            (self.fruit, self.near, 'piece', 10),
+            (self.fruit, self.far, 'kg', 60),
+            (self.bread, self.near, 'piece', 150),
+            (self.bread, self.far, 'piece', 600),
+            (self.fruit, self.near, 'kg', 1500),
+        ]
+        for category, manufacturer, unit, price in rows:
+            create_products(1, category=category, manufacturer=manufacturer, unit=unit, price=price)
+
+    def get_facets(self, query):
+        response = APIClient().get(f'/api/products?facets=1&{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_each_facet_leaves_out_its_own_filter(self):
+        data = self.get_facets(f'category={self.fruit.id}&unit=piece')
+        self.assertEqual(len(data['results']), 1)
+        facets = data['facets']
+        # Pieces of every category, fruit of every unit
+        self.assertEqual(facets['category'], [
+            {'id': self.bread.id, 'name': 'Bread', 'count': 2}, {'id': self.fruit.id, 'name': 'Fruit', 'count': 1},
+        ])
+        self.assertEqual(facets['unit'], [{'value': 'kg', 'count': 2}, {'value': 'piece', 'count': 1}])
+        self.assertEqual(facets['manufacturer'], [{'id': self.near.id, 'name': 'Near', 'count': 1}])
+        self.assertEqual(facets['price']['min'], 10)
+        self.assertEqual([bucket['count'] for bucket in facets['price']['buckets']], [1, 0, 0, 0, 0, 0])
+
+    def test_country_narrows_the_manufacturer_facet(self):
+        facets = self.get_facets(f'country={self.country.id}')['facets']
+        self.assertEqual(facets['manufacturer'], [{'id': self.far.id, 'name': 'Far', 'count': 2}])
+        self.assertEqual(sum(row['count'] for row in facets['category']), 2)
+
+    def test_price_histogram(self):
+        price = self.get_facets('')['facets']['price']
+        self.assertEqual((price['min'], price['max']), (10, 1500))
+        self.assertEqual(
+            [(bucket['min'], bucket['max'], bucket['count']) for bucket in price['buckets']],
+            [(0, 49, 1), (50, 99, 1), (100, 199, 1), (200, 499, 0), (500, 999, 1), (1000, None, 1)],
+        )
+        # The price filter narrows every facet but the histogram itself
+        facets = self.get_facets('price_min=100&price_max=999')['facets']
+        self.assertEqual(sum(bucket['count'] for bucket in facets['price']['buckets']), 5)
+        self.assertEqual(facets['unit'], [{'value': 'piece', 'count': 2}])
+
+
+class ExportTests(TestCase):
+    def test_products_export_applies_the_list_filters(self):
+        client = APIClient()
+        client.force_authenticate(create_customer(is_staff=True))
+        products = create_products(4, price=10)
+        Product.objects.filter(id=products[1].id).update(price=500)
+        expired = products[2]
+        expired.expired_date = timezone.localdate() - datetime.timedelta(days=1)
+        expired.save()
+
+        for query in ('price_max=100&hide_expired=1', 'price_max=100&hide_expired=1&order_by=-price'):
+            response = client.get(f'/api/products/export?format=ndjson&{query}')
+            self.assertEqual(response.status_code, 200)
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+            self.assertEqual(sorted(row['id'] for row in rows), [products[0].id, products[3].id], query)
+            list_ids = [row['id'] for row in client.get(f'/api/products?{query}').json()['results']]
+            self.assertEqual([row['id'] for row in rows], list_ids, query)
+
+        self.assertEqual(client.get('/api/products/export?format=ndjson&unit=gallon').status_code, 400)
+
+    def test_orders_export_applies_the_list_search(self):
+        client = APIClient()
+        customer = create_customer(is_staff=True)
+        client.force_authenticate(customer)
+        for product in create_products(2):
+            Order.objects.create(product=product, customer=customer, delivery_address='-')
+        response = client.get('/api/orders/export?format=ndjson&search=product 1')
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        list_ids = [row['id'] for row in client.get('/api/orders?search=product 1').json()['results']]
+        self.assertEqual([row['id'] for row in rows], list_ids)
+        self.assertEqual(len(rows), 1)
+
+
+def place_order(client, product):
+    return client.post('/api/orders', {'product': product.id, 'delivery_address': '-'})
+
+
+class WalletCheckoutTests(TransactionTestCase):
+    def assertWalletBalances(self, customer, product, initial):
+        customer.refresh_from_db()
+        paid = sum(product.price - order.final_price for order in Order.objects.filter(customer=customer))
+        self.assertGreaterEqual(customer.wallet, 0)
+        self.assertEqual(paid + customer.wallet, initial)
+
+    def test_wallet_is_drained_not_overdrawn(self):
+        customer = create_customer(wallet=25)
+        product = create_products(1, price=10)[0]
+        client = APIClient()
+        client.force_authenticate(customer)
+        for _ in range(4):
+            self.assertEqual(place_order(client, product).status_code, 201)
+        final_prices = Order.objects.filter(customer=customer).order_by('id').values_list('final_price', flat=True)
+        self.assertEqual(list(final_prices), [0, 0, 5, 10])
+        self.assertWalletBalances(customer, product, 25)
+
+    @skipIf(connection.vendor == 'sqlite', 'SQLite locks the whole database for each writer')
+    def test_concurrent_orders_never_overdraw(self):
+        customer = create_customer(wallet=100)
+        product = create_products(1, price=7)[0]
+        statuses = []
+
+        def place_orders():
+            client = APIClient()
+            client.force_authenticate(customer)
+            try:
+                statuses.extend(place_order(client, product).status_code for _ in range(5))
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=place_orders) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [201] * 40)
+        self.assertWalletBalances(customer, product, 100)
+
+    def test_order_query_count(self):
+        customer = create_customer(wallet=100)
+        product = create_products(1, price=7)[0]
+        client = APIClient()
+        # Authenticated as in production, with only the token's columns loaded
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_token(customer)}')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(place_order(client, product).status_code, 201)
+        # Product lookup, wallet update, order insert and summary upsert (plus BEGIN on SQLite)
+        self.assertLessEqual(len(queries), 5)
+        self.assertFalse([query for query in queries if 'FROM "shop_customer"' in query['sql']])
+        self.assertEqual(Order.objects.get(customer=customer).phone_customer, customer.phone)
+
+
+class SortKeyTests(TestCase):
+    def test_undeclared_order_by_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(create_customer(is_staff=True))
+        for url in ('/api/products?order_by=description', '/api/products?order_by=manufacturer__name',
+                    '/api/orders?order_by=customer__password', '/api/products/export?order_by=image'):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('order_by must be one of', json.loads(response.content)['message'], url)
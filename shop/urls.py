@@ -1,51 +1,40 @@
-from django.urls import path
-from .views import *
-
-from drf_yasg.views import get_schema_view
-
-from django.urls import path, re_path, include
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Your API",
-      default_version='v1',
-      description="Your API description",
-      terms_of_service="https://www.yourapp.com/terms/",
-      contact=openapi.Contact(email="contact@yourapp.com"),
-      license=openapi.License(name="Your License"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+from django.urls import path, re_path
+from .startup import LazyView
 
 
 urlpatterns = [
-    path('category', CategoryApiView.as_view()),
-    path('category/<int:pk>', CategoryDetailApiView.as_view()),
+    path('category', LazyView('shop.views.CategoryApiView')),
+    path('category/<int:pk>', LazyView('shop.views.CategoryDetailApiView')),
+
+    path('products', LazyView('shop.views.ProductsApiView')),
+    path('products/<int:pk>', LazyView('shop.views.ProductsDetailApiView')),
+    path('products/import', LazyView('shop.views.ProductsImportApiView')),
+    path('products/export', LazyView('shop.views.ProductsExportApiView')),
+    path('products/expiring', LazyView('shop.views.ProductsExpiringApiView')),
+    path('products/expiring/categories', LazyView('shop.views.ProductsExpiryCategoriesApiView')),
 
-    path('products', ProductsApiView.as_view()),
-    path('products/<int:pk>', ProductsDetailApiView.as_view()),
+    path('manufacturer', LazyView('shop.views.ManufacturerApiView')),
+    path('manufacturer/<int:pk>', LazyView('shop.views.ManufacturerDetailApiView')),
 
-    path('manufacturer', ManufacturerApiView.as_view()),
-    path('manufacturer/<int:pk>', ManufacturerDetailApiView.as_view()),
+    path('сountry', LazyView('shop.views.CountryApiView')),
+    path('сountry/<int:pk>', LazyView('shop.views.CountryDetailApiView')),
 
-    path('сountry', CountryApiView.as_view()),
-    path('сountry/<int:pk>', CountryDetailApiView.as_view()),
+    path('orders', LazyView('shop.views.OrderApiView')),
+    path('orders/<int:pk>', LazyView('shop.views.OrderDetailApiView')),
+    path('orders/export', LazyView('shop.views.OrderExportApiView')),
+    path('orders/checkout', LazyView('shop.views.CartCheckoutApiView')),
 
-    path('orders', OrderApiView.as_view()),
-    path('orders/<int:pk>', OrderDetailApiView.as_view()),
+    path('cache', LazyView('shop.views.CacheStatsApiView')),
+    path('metrics', LazyView('shop.views.MetricsApiView')),
+    path('analytics/sales/<str:dimension>', LazyView('shop.views.SalesSummaryApiView')),
 
 
-    path('sign_in', AuthApiView.as_view()),
-    path('sign_out', LogOutApiView.as_view()),
-    path('profile', ProfileApiView.as_view()),
-    path('sign_up', RegistrationApiView.as_view()),
+    path('sign_in', LazyView('shop.views.AuthApiView')),
+    path('sign_out', LazyView('shop.views.LogOutApiView')),
+    path('profile', LazyView('shop.views.ProfileApiView')),
+    path('sign_up', LazyView('shop.views.RegistrationApiView')),
     
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    re_path(r'^swagger\.(?P<format>json|yaml)$', LazyView('shop.schema.schema_view'), name='schema-json'),
+    path('swagger/', LazyView('shop.schema.schema_ui_view'), {'ui': 'swagger'}, name='schema-swagger-ui'),
+    path('redoc/', LazyView('shop.schema.schema_ui_view'), {'ui': 'redoc'}, name='schema-redoc'),
 ]
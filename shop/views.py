@@ -4,38 +4,191 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.status import HTTP_200_OK, HTTP_403_FORBIDDEN, HTTP_400_BAD_REQUEST
 from rest_framework import permissions
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import JSONParser, MultiPartParser
 
 
 from .models import *
 from .serializers import *
-
-from django.contrib.auth import login, logout, authenticate
+from .pagination import KeysetPagination
+from .search import search_products
+from .facets import filter_products, get_facets, get_product_filters
+from .sorting import SortKeys
+from .importers import CONTENT_TYPES, READERS, ProductImporter
+from .exporters import ORDER_COLUMNS, PRODUCT_COLUMNS, CSVRenderer, NDJSONRenderer, export_response
+from .checkout import charge_wallet, checkout_cart
+from .cache import cache_response, conditional_response, get_stats, get_versions
+from .authentication import get_token_lifetime, issue_token, load_customer, revoke_tokens
+from .schema import openapi, swagger_auto_schema
+from .images import queue_variants
+from .analytics import DIMENSION_KEYS, get_summary
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+import datetime
+
+
+def get_products_state(view, request):
+    # Every page, facet count and ?ids= batch of the catalog reads products and
+    # the names of their manufacturer and category, so their collection
+    # versions stamp them all. The date is part of it because hide_expired and
+    # expiring_within move with it.
+    return [*get_versions([Product, Manufacturer, Category]), timezone.localdate()]
+
+
+def get_product_state(view, request, pk):
+    return Product.objects.filter(id=pk).values_list(
+        'updated_at', 'manufacturer__updated_at', 'category__updated_at'
+    ).first()
+
+
+def get_orders_state(view, request):
+    # Orders show the customer's email and the product name; the customer's own
+    # columns are not loaded by token authentication, so their version stands in
+    return [request.user.pk, *get_versions([Order, Product, Customer])]
+
+
+def get_order_state(view, request, pk):
+    return Order.objects.filter(id=pk).values_list('updated_at', 'product__updated_at').first()
+
+
+def get_expiry_days(request):
+    days = int(request.GET.get('days', 7))
+    if not 0 <= days <= 365:
+        raise ValueError('days must be between 0 and 365')
+    return days
+
+
+def get_flag(request, name, default=False):
+    if name not in request.GET.keys():
+        return default
+    return request.GET.get(name).lower() in ('1', 'true', 'yes')
+
+
+def get_requested_fields(request):
+    # ?fields=id,name,price -> ['id', 'name', 'price'], or None for every field
+    if 'fields' not in request.GET.keys():
+        return None
+    fields = [field.strip() for field in request.GET.get('fields').split(',') if field.strip()]
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if not fields or unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}' if unknown else 'fields must not be empty')
+    return fields
+
+
+def get_requested_ids(request):
+    # ?ids=3,1,2 -> [3, 1, 2] with repeats dropped
+    try:
+        ids = [int(pk) for pk in request.GET.get('ids').split(',') if pk.strip()]
+    except ValueError:
+        raise ValueError('ids must be a comma separated list of ids')
+    if not ids:
+        raise ValueError('ids must not be empty')
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > KeysetPagination.max_page_size:
+        raise ValueError(f'At most {KeysetPagination.max_page_size} ids can be fetched at once')
+    return ids
+
+
+def get_batch_response(queryset, ids, serialize):
+    """
+    Fetch ``ids`` from ``queryset`` with one ``IN`` query and answer with
+    the rows in the requested order and the ids that were not found.
+    """
+    rows = {
+        row['id'] if isinstance(row, dict) else row.id: row
+        for row in queryset.filter(id__in=ids).order_by()
+    }
+    return Response({
+        'results': serialize([rows[pk] for pk in ids if pk in rows]),
+        'missing': [pk for pk in ids if pk not in rows],
+    }, status=HTTP_200_OK)
+
+
+PAGINATION_PARAMETERS = [
+    openapi.Parameter(name='cursor', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+    openapi.Parameter(name='page_size', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+]
+IDS_PARAMETER = openapi.Parameter(
+    name='ids', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+    description='Comma separated ids to fetch instead of a page; answers with results in that order and '
+                'the missing ids. The other parameters except fields are ignored',
+)
+
+
+def filter_catalog(request, products):
+    # hide_expired and search, which every product listing applies before the facet filters
+    if get_flag(request, 'hide_expired', getattr(settings, 'SHOP_HIDE_EXPIRED_PRODUCTS', False)):
+        products = products.unexpired()
+    if 'search' in request.GET.keys():
+        search = request.GET.get('search')
+        products = search_products(products, search)
+    return products
+
+
+def filter_orders(request, orders):
+    # The orders list filters, which the export takes as well
+    if 'search' in request.GET.keys():
+        search = request.GET.get('search')
+        orders = orders.filter(product__name__icontains=search)
+    return orders
+
+
+def get_order_by_parameter(sort_keys):
+    return openapi.Parameter(name='order_by', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                             enum=sort_keys.choices, required=False)
+
+
+# The filters of the product list, which the export takes as well
+PRODUCT_FILTER_PARAMETERS = [
+    openapi.Parameter(name='search', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+    openapi.Parameter(name='hide_expired', in_=openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, required=False),
+    openapi.Parameter(name='category', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                      description='Comma separated category ids'),
+    openapi.Parameter(name='manufacturer', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                      description='Comma separated manufacturer ids'),
+    openapi.Parameter(name='country', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                      description='Comma separated country ids of the manufacturer'),
+    openapi.Parameter(name='unit', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                      description='Comma separated units'),
+    openapi.Parameter(name='price_min', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+    openapi.Parameter(name='price_max', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+]
+PRODUCT_SORT_KEYS = SortKeys(id='id', name='name', price='price', expired_date='expired_date', updated_at='updated_at')
 
 class CategoryApiView(APIView):
     permission_classes = [permissions.AllowAny, ]
+    # A small lookup table, like countries: sorting it by name needs no index
+    sort_keys = SortKeys(id='id', name='name')
 
     @swagger_auto_schema(
         manual_parameters=[
-            openapi.Parameter(name='order_by', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            get_order_by_parameter(sort_keys),
             openapi.Parameter(name='search', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            *PAGINATION_PARAMETERS,
         ],
         responses={
-            200: CategorySerializer()
+            200: CategorySerializer(),
+            400: 'Bad request',
         }
     )
+    @cache_response(Category)
     def get(self, request):
-        categories = Category.objects.all()
-        if 'order_by' in request.GET.keys():
-            ordering = request.GET.get('order_by')
-            categories = categories.order_by(ordering)
+        try:
+            categories = self.sort_keys.apply(Category.objects.all(), request.GET)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
         if 'search' in request.GET.keys():
             search = request.GET.get('search')
             categories = categories.filter(name__contains=search)
-        data = CategorySerializer(categories, many=True).data
-        return Response(data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(categories, request, view=self)
+        data = CategorySerializer(page, many=True).data
+        return paginator.get_paginated_response(data)
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
@@ -65,6 +218,7 @@ class CategoryDetailApiView(APIView):
     permission_classes = [permissions.AllowAny, ]
 
     @swagger_auto_schema(responses={200: CategorySerializer()})
+    @cache_response(Category)
     def get(self, request, pk):
         category = Category.objects.get(id=pk)
         data = CategorySerializer(category).data
@@ -101,26 +255,38 @@ class CategoryDetailApiView(APIView):
 
 class ManufacturerApiView(APIView):
     permission_classes = [permissions.AllowAny, ]
+    sort_keys = SortKeys(id='id', name='name')
 
     @swagger_auto_schema(
         manual_parameters=[
-            openapi.Parameter(name='order_by', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            get_order_by_parameter(sort_keys),
             openapi.Parameter(name='search', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            IDS_PARAMETER,
+            *PAGINATION_PARAMETERS,
         ],
         responses={
-            200: ManufacturerSerializer()
+            200: ManufacturerSerializer(),
+            400: 'Bad request',
         }
     )
+    @cache_response(Manufacturer, Country)
     def get(self, request):
-        manufacturer = Manufacturer.objects.all()
-        if 'order_by' in request.GET.keys():
-            ordering = request.GET.get('order_by')
-            manufacturer = manufacturer.order_by(ordering)
+        try:
+            if 'ids' in request.GET.keys():
+                return get_batch_response(
+                    Manufacturer.objects.select_related('country'), get_requested_ids(request),
+                    lambda rows: ManufacturerSerializer(rows, many=True).data,
+                )
+            manufacturer = self.sort_keys.apply(Manufacturer.objects.select_related('country'), request.GET)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
         if 'search' in request.GET.keys():
             search = request.GET.get('search')
             manufacturer = manufacturer.filter(name__contains=search)
-        data = ManufacturerSerializer(manufacturer, many=True).data
-        return Response(data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(manufacturer, request, view=self)
+        data = ManufacturerSerializer(page, many=True).data
+        return paginator.get_paginated_response(data)
 
 
     @swagger_auto_schema(
@@ -155,8 +321,9 @@ class ManufacturerDetailApiView(APIView):
     permission_classes = [permissions.AllowAny, ]
 
     @swagger_auto_schema(responses={200: ManufacturerSerializer()})
+    @cache_response(Manufacturer, Country)
     def get(self, request, pk):
-        manufacturer = Manufacturer.objects.get(id=pk)
+        manufacturer = Manufacturer.objects.select_related('country').get(id=pk)
         data = ManufacturerSerializer(manufacturer).data
         return Response(data, status=status.HTTP_200_OK)
 
@@ -170,7 +337,7 @@ class ManufacturerDetailApiView(APIView):
     )
     def patch(self, request, pk):
         if request.user.is_staff:
-            manufacturer = Manufacturer.objects.get(id=pk)
+            manufacturer = Manufacturer.objects.select_related('country').get(id=pk)
             serializer = ManufacturerSerializer(manufacturer, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
@@ -191,26 +358,32 @@ class ManufacturerDetailApiView(APIView):
 
 class CountryApiView(APIView):
     permission_classes = [permissions.AllowAny, ]
+    sort_keys = SortKeys(id='id', name='name')
 
     @swagger_auto_schema(
         manual_parameters=[
-            openapi.Parameter(name='order_by', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            get_order_by_parameter(sort_keys),
             openapi.Parameter(name='search', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            *PAGINATION_PARAMETERS,
         ],
         responses={
-            200: CountrySerializer()
+            200: CountrySerializer(),
+            400: 'Bad request',
         }
     )
+    @cache_response(Country)
     def get(self, request):
-        country = Country.objects.all()
-        if 'order_by' in request.GET.keys():
-            ordering = request.GET.get('order_by')
-            country = country.order_by(ordering)
+        try:
+            country = self.sort_keys.apply(Country.objects.all(), request.GET)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
         if 'search' in request.GET.keys():
             search = request.GET.get('search')
             country = country.filter(name__contains=search)
-        data = CountrySerializer(country, many=True).data
-        return Response(data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(country, request, view=self)
+        data = CountrySerializer(page, many=True).data
+        return paginator.get_paginated_response(data)
 
 
     @swagger_auto_schema(
@@ -243,6 +416,7 @@ class CountryDetailApiView(APIView):
     permission_classes = [permissions.AllowAny, ]
 
     @swagger_auto_schema(responses={200: CountrySerializer()})
+    @cache_response(Country)
     def get(self, request, pk):
         country = Country.objects.get(id=pk)
         data = CountrySerializer(country).data
@@ -280,26 +454,50 @@ class CountryDetailApiView(APIView):
 class ProductsApiView(APIView):
     permission_classes = [permissions.AllowAny]
     parser_classes = [MultiPartParser, ]
+    sort_keys = PRODUCT_SORT_KEYS
 
     @swagger_auto_schema(
         manual_parameters=[
-            openapi.Parameter(name='order_by', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
-            openapi.Parameter(name='search', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            get_order_by_parameter(sort_keys),
+            *PRODUCT_FILTER_PARAMETERS,
+            openapi.Parameter(name='facets', in_=openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, required=False,
+                              description='Add counts per category, manufacturer and unit and a price histogram'),
+            openapi.Parameter(name='fields', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                              description='Comma separated keys to return, e.g. id,name,price'),
+            IDS_PARAMETER,
+            *PAGINATION_PARAMETERS,
         ],
         responses={
-            200: ProductsSerializer()
+            200: ProductsSerializer(),
+            400: 'Bad request',
         }
     )
+    @conditional_response(get_products_state, use_last_modified=False)
     def get(self, request):
-        products = Product.objects.all()
-        if 'order_by' in request.GET.keys():
-            ordering = request.GET.get('order_by')
-            products = products.order_by(ordering)
-        if 'search' in request.GET.keys():
-            search = request.GET.get('search')
-            products = products.filter(name__contains=search).union(products.filter(description__contains=search))
-        data = ProductsSerializer(products, many=True).data
-        return Response(data, status=status.HTTP_200_OK)
+        try:
+            fields = get_requested_fields(request)
+            if 'ids' in request.GET.keys():
+                products = project_products(Product.objects.select_related('manufacturer', 'category'), fields)
+                return get_batch_response(products, get_requested_ids(request), lambda rows: serialize_products(rows, fields))
+            filters = get_product_filters(request.GET)
+            products = self.get_queryset(request)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(project_products(products, fields), request, view=self)
+        data = serialize_products(page, fields)
+        response = paginator.get_paginated_response(data)
+        if get_flag(request, 'facets'):
+            response.data['facets'] = get_facets(self.get_unfiltered_queryset(request), filters)
+        return response
+
+    def get_queryset(self, request):
+        products = filter_products(self.get_unfiltered_queryset(request), get_product_filters(request.GET))
+        return self.sort_keys.apply(products, request.GET)
+
+    def get_unfiltered_queryset(self, request):
+        # Everything but the facet filters, which get_facets applies one by one
+        return filter_catalog(request, Product.objects.select_related('manufacturer', 'category'))
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -324,21 +522,161 @@ class ProductsApiView(APIView):
         if request.user.is_staff:
             serializer = ProductsCreateSerializer(data=request.data)
             if serializer.is_valid():
-                serializer.save()
+                product = serializer.save()
+                queue_variants(product)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         else:
             return Response({'message': 'Only admin can add products'}, status=HTTP_403_FORBIDDEN)
 
 
+class ProductsImportApiView(APIView):
+    permission_classes = [permissions.AllowAny, ]
+
+    @swagger_auto_schema(
+        operation_description='Stream a CSV (text/csv) or NDJSON (application/x-ndjson) body of products. '
+                              'Rows with an id, or matching an existing product on manufacturer and name, '
+                              'update it; other rows create products.',
+        responses={
+            200: 'Import report with created/updated counts and per-row errors',
+            403: 'Only admin can import products',
+            415: 'Unsupported content type',
+        }
+    )
+    def post(self, request):
+        if request.user.is_staff:
+            content_type = request.content_type.split(';')[0].strip().lower()
+            if content_type not in CONTENT_TYPES:
+                return Response({'message': f'Send one of: {", ".join(CONTENT_TYPES)}'},
+                                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+            rows = READERS[CONTENT_TYPES[content_type]](request.stream or [])
+            report = ProductImporter().run(rows)
+            return Response(report, status=status.HTTP_200_OK)
+        else:
+            return Response({'message': 'Only admin can import products'}, status=HTTP_403_FORBIDDEN)
+
+
+class ProductsExportApiView(APIView):
+    permission_classes = [permissions.AllowAny, ]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    sort_keys = PRODUCT_SORT_KEYS
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(name='format', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['ndjson', 'csv'], required=False),
+            get_order_by_parameter(sort_keys),
+            *PRODUCT_FILTER_PARAMETERS,
+        ],
+        responses={
+            200: 'Streamed NDJSON or CSV rows',
+            400: 'Bad request',
+            403: 'Only admin can export products'
+        }
+    )
+    def get(self, request):
+        if request.user.is_staff:
+            try:
+                # The same rows as the product list with the same parameters
+                products = filter_products(filter_catalog(request, Product.objects.order_by('id')), get_product_filters(request.GET))
+                products = self.sort_keys.apply(products, request.GET)
+            except ValueError as error:
+                return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
+            return export_response(products, PRODUCT_COLUMNS, request.accepted_renderer.format, 'products')
+        else:
+            return Response({'message': 'Only admin can export products'}, status=HTTP_403_FORBIDDEN)
+
+
+class ProductsExpiringApiView(APIView):
+    permission_classes = [permissions.AllowAny, ]
+
+    @swagger_auto_schema(
+        operation_description='Products expiring within the next `days` days, soonest first, '
+                              'or with status=expired the expired ones, most recent first.',
+        manual_parameters=[
+            openapi.Parameter(name='days', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+            openapi.Parameter(name='status', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['expiring', 'expired'], required=False),
+            openapi.Parameter(name='category', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+            openapi.Parameter(name='fields', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                              description='Comma separated keys to return, e.g. id,name,price'),
+            *PAGINATION_PARAMETERS,
+        ],
+        responses={
+            200: ProductsSerializer(),
+            400: 'Bad request',
+        }
+    )
+    @conditional_response(get_products_state, use_last_modified=False)
+    def get(self, request):
+        try:
+            products = self.get_queryset(request)
+            fields = get_requested_fields(request)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(project_products(products, fields), request, view=self)
+        data = serialize_products(page, fields)
+        return paginator.get_paginated_response(data)
+
+    def get_queryset(self, request):
+        products = Product.objects.select_related('manufacturer', 'category')
+        if request.GET.get('status', 'expiring') == 'expired':
+            products = products.expired().order_by('-expired_date')
+        elif request.GET.get('status', 'expiring') == 'expiring':
+            products = products.expiring(get_expiry_days(request)).order_by('expired_date')
+        else:
+            raise ValueError('status must be expiring or expired')
+        if 'category' in request.GET.keys():
+            products = products.filter(category_id=int(request.GET.get('category')))
+        return products
+
+
+class ProductsExpiryCategoriesApiView(APIView):
+    permission_classes = [permissions.AllowAny, ]
+
+    @swagger_auto_schema(
+        operation_description='Per category, the number of products that expired in the last `days` days and of products expiring within the next `days` days.',
+        manual_parameters=[
+            openapi.Parameter(name='days', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+        ],
+        responses={
+            200: 'Counts per category',
+            400: 'Bad request',
+        }
+    )
+    # Cached per Product version, which the daily sweep_expired_products run bumps
+    @cache_response(Product, Category)
+    def get(self, request):
+        try:
+            days = get_expiry_days(request)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
+        results = [
+            {'category': row['category_id'], 'name': row['category__name'], 'expired': row['expired'], 'expiring': row['expiring']}
+            for row in Product.objects.expiry_by_category(days)
+        ]
+        return Response({'days': days, 'results': results}, status=HTTP_200_OK)
+
+
 class ProductsDetailApiView(APIView):
     permission_classes = [permissions.AllowAny, ]
     parser_classes = [MultiPartParser, ]
 
-    @swagger_auto_schema(responses={200: ProductsSerializer()})
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(name='fields', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                              description='Comma separated keys to return, e.g. id,name,price'),
+        ],
+        responses={200: ProductsSerializer()}
+    )
+    @conditional_response(get_product_state)
     def get(self, request, pk):
-        product = Product.objects.get(id=pk)
-        data = ProductsSerializer(product).data
+        try:
+            fields = get_requested_fields(request)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
+        products = Product.objects.select_related('manufacturer', 'category').filter(id=pk)
+        product = project_products(products, fields).get()
+        data = serialize_products(product, fields, many=False)
         return Response(data, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -362,10 +700,12 @@ class ProductsDetailApiView(APIView):
     )
     def patch(self, request, pk):
         if request.user.is_staff:
-            product = Product.objects.get(id=pk)
+            product = Product.objects.select_related('manufacturer', 'category').get(id=pk)
             serializer = ProductsSerializer(product, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
+                if 'image' in serializer.validated_data:
+                    queue_variants(product)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         else:
@@ -394,7 +734,7 @@ class AuthApiView(APIView):
             }
         ),
         responses={
-            200: 'Welcome!',
+            200: 'Welcome! The body carries a bearer token for the Authorization header',
             403: 'Username or/and Password is not valid!',
         }
     )
@@ -403,8 +743,7 @@ class AuthApiView(APIView):
         password = request.data['password']
         user = authenticate(username=username, password=password)
         if user is not None:
-            login(request, user)
-            data = {'message': 'Welcome!'}
+            data = {'message': 'Welcome!', 'token': issue_token(user), 'expires_in': get_token_lifetime()}
             return Response(data, HTTP_200_OK)
         else:
             data = {'message': 'Username or/and Password is not valid!'}
@@ -416,7 +755,7 @@ class ProfileApiView(APIView):
 
     @swagger_auto_schema(responses={200: UserSerializer()})
     def get(self, request):
-        user = request.user
+        user = load_customer(request.user)
         data = UserSerializer(user).data
         return Response(data, status=HTTP_200_OK)
 
@@ -428,11 +767,14 @@ class ProfileApiView(APIView):
         }
     )
     def patch(self, request):
-        user = request.user
+        user = load_customer(request.user)
         serializer = UserUpdateSerializer(user, request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             data = UserSerializer(user).data
+            if isinstance(request.auth, dict) and request.auth.get('p') != user.phone:
+                # The phone is part of the token, so the change revoked it; here is its replacement
+                data['token'] = issue_token(user)
             return Response(data, status=HTTP_200_OK)
         return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
 
@@ -475,7 +817,7 @@ class LogOutApiView(APIView):
     permission_classes = [IsAuthenticated, ]
 
     def get(self, request):
-        logout(request)
+        revoke_tokens(request.user.pk)
         return Response({'message': 'You logged out successfully'}, status=HTTP_200_OK)
 
 
@@ -484,28 +826,40 @@ class LogOutApiView(APIView):
 class OrderApiView(APIView):
     permission_classes = [IsAuthenticated, ]
     parser_classes = [MultiPartParser, ]
+    # Served by the (customer, id) and (customer, status, id) indexes
+    sort_keys = SortKeys(id='id', status='status')
 
     @swagger_auto_schema(
         manual_parameters=[
-            openapi.Parameter(name='order_by', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            get_order_by_parameter(sort_keys),
             openapi.Parameter(name='search', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            IDS_PARAMETER,
+            *PAGINATION_PARAMETERS,
         ],
         responses={
-            200: CategorySerializer()
+            200: CategorySerializer(),
+            400: 'Bad request',
         }
     )
+    @conditional_response(get_orders_state, use_last_modified=False)
     def get(self,request):
+        try:
+            if 'ids' in request.GET.keys():
+                # Other customers' orders are reported as missing
+                orders = Order.objects.select_related('product', 'customer').filter(customer=request.user)
+                return get_batch_response(orders, get_requested_ids(request), lambda rows: OrderSerializer(rows, many=True).data)
+            order = self.get_queryset(request)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(order, request, view=self)
+        data = OrderSerializer(page, many=True).data
+        return paginator.get_paginated_response(data)
+
+    def get_queryset(self, request):
         user = request.user
-        order = Order.objects.filter(customer=user)
-        if 'order_by' in request.GET.keys():
-            ordering = request.GET.get('order_by')
-            order = order.order_by(ordering)
-        if 'search' in request.GET.keys():
-            search = request.GET.get('search')
-            order = order.filter(name__contains=search)
-        data = OrderSerializer(order, many=True).data
-        return Response(data, status=status.HTTP_200_OK)
-
+        order = self.sort_keys.apply(Order.objects.select_related('product', 'customer').filter(customer=user), request.GET)
+        return filter_orders(request, order)
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -518,36 +872,80 @@ class OrderApiView(APIView):
         }
     )
     def post(self, request):
-        product = Product.objects.get(id=request.data['product'])
-        user = Customer.objects.get(email=request.user)
-        total = 0
-        if user.wallet > product.price:
-            user.wallet -= product.price
-            user.save()
-            total = 0
-        if user.wallet < product.price:
-            product.price -= user.wallet
-            total = product.price
-            user.wallet = 0
-            user.save()
-        if user.wallet == product.price:
-            user.wallet = 0
-            user.save()
-            total = 0
-        serializer = OrderCreateSerializer(data=request.data,context={'request': request,'final_price': total})
+        serializer = OrderCreateSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            price = serializer.validated_data['product'].price
+            with transaction.atomic():
+                paid = charge_wallet(request.user, price)
+                serializer.save(customer=request.user, final_price=price - paid)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class CartCheckoutApiView(APIView):
+    permission_classes = [IsAuthenticated, ]
+    parser_classes = [JSONParser, ]
+
+    @swagger_auto_schema(
+        request_body=CartCheckoutSerializer(),
+        responses={
+            201: OrderSerializer(many=True),
+            400: 'Bad request',
+        }
+    )
+    def post(self, request):
+        serializer = CartCheckoutSerializer(data=request.data)
+        if serializer.is_valid():
+            orders = checkout_cart(request.user, **serializer.validated_data)
+            total = sum(order.product.price * order.quantity for order in orders)
+            final_price = sum(order.final_price for order in orders)
+            data = {
+                'orders': OrderSerializer(orders, many=True).data,
+                'total': total,
+                'paid_from_wallet': total - final_price,
+                'final_price': final_price,
+            }
+            return Response(data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class OrderExportApiView(APIView):
+    permission_classes = [permissions.AllowAny, ]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    # All customers' orders, so only the primary key is index-backed
+    sort_keys = SortKeys(id='id')
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(name='format', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['ndjson', 'csv'], required=False),
+            get_order_by_parameter(sort_keys),
+            openapi.Parameter(name='search', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+        ],
+        responses={
+            200: 'Streamed NDJSON or CSV rows',
+            400: 'Bad request',
+            403: 'Only admin can export orders'
+        }
+    )
+    def get(self, request):
+        if request.user.is_staff:
+            try:
+                order = self.sort_keys.apply(filter_orders(request, Order.objects.order_by('id')), request.GET)
+            except ValueError as error:
+                return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
+            return export_response(order, ORDER_COLUMNS, request.accepted_renderer.format, 'orders')
+        else:
+            return Response({'message': 'Only admin can export orders'}, status=HTTP_403_FORBIDDEN)
+
+
 class OrderDetailApiView(APIView):
     permission_classes = [permissions.AllowAny, ]
     parser_classes = [MultiPartParser, ]
 
     @swagger_auto_schema(responses={200: OrderSerializer()})
+    @conditional_response(get_order_state)
     def get(self, request, pk):
-        order = Order.objects.get(id=pk)
+        order = Order.objects.select_related('product', 'customer').get(id=pk)
         data = OrderSerializer(order).data
         return Response(data, status=status.HTTP_200_OK)
 
@@ -570,7 +968,7 @@ class OrderDetailApiView(APIView):
             serializer = OrderPatchSerializer(order, data=request.data, partial=True, context={'request': request})
             if serializer.is_valid():
                 if request.data["status"] == "delivery":
-                    customer_wallet = Customer.objects.get(email=request.user)
+                    customer_wallet = Customer.objects.get(pk=request.user.pk)
                     customer_wallet.wallet += 500
                     customer_wallet.save()
                 serializer.save()
@@ -590,6 +988,59 @@ class OrderDetailApiView(APIView):
             return Response({'message': 'Only admin can delete a order'}, status=HTTP_403_FORBIDDEN)
 
 
+class CacheStatsApiView(APIView):
+    permission_classes = [permissions.IsAdminUser, ]
+
+    @swagger_auto_schema(responses={200: 'Response cache hits and misses per view'})
+    def get(self, request):
+        return Response(get_stats(), status=status.HTTP_200_OK)
+
+
+class MetricsApiView(APIView):
+    permission_classes = [permissions.IsAdminUser, ]
+
+    @swagger_auto_schema(responses={200: 'Per-route request histograms in the Prometheus text format'})
+    def get(self, request):
+        return HttpResponse(registry.export(), content_type=METRICS_CONTENT_TYPE)
 
 
+class SalesSummaryApiView(APIView):
+    permission_classes = [IsAuthenticated, ]
 
+    @swagger_auto_schema(
+        operation_description='Order totals per day (group=day) or per product, category or manufacturer '
+                              '(group=total) between start and end, read from the sales summary tables.',
+        manual_parameters=[
+            openapi.Parameter(name='start', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE, required=False),
+            openapi.Parameter(name='end', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE, required=False),
+            openapi.Parameter(name='id', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+            openapi.Parameter(name='group', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['day', 'total'], required=False),
+            openapi.Parameter(name='limit', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+        ],
+        responses={
+            200: 'Summary rows',
+            400: 'Bad request',
+            403: 'Only admin can read sales summaries',
+        }
+    )
+    def get(self, request, dimension):
+        if not request.user.is_staff:
+            return Response({'message': 'Only admin can read sales summaries'}, status=HTTP_403_FORBIDDEN)
+        if dimension not in DIMENSION_KEYS:
+            return Response({'message': f'Unknown dimension "{dimension}"'}, status=status.HTTP_404_NOT_FOUND)
+        group = request.GET.get('group', 'day')
+        try:
+            end = datetime.date.fromisoformat(request.GET['end']) if 'end' in request.GET else timezone.localdate()
+            start = datetime.date.fromisoformat(request.GET['start']) if 'start' in request.GET else end - datetime.timedelta(days=30)
+            key = int(request.GET['id']) if 'id' in request.GET else None
+            limit = min(int(request.GET.get('limit', 100)), 1000)
+        except ValueError as error:
+            return Response({'message': str(error)}, status=HTTP_400_BAD_REQUEST)
+        if group not in ('day', 'total'):
+            return Response({'message': 'group must be day or total'}, status=HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'message': 'limit must be a positive integer'}, status=HTTP_400_BAD_REQUEST)
+
+        results = get_summary(dimension, start, end, key=key, group=group, limit=limit)
+        data = {'dimension': dimension, 'group': group, 'start': start, 'end': end, 'results': results}
+        return Response(data, status=HTTP_200_OK)